@@ -0,0 +1,298 @@
+import os
+os.environ.setdefault("PANDA_HEADLESS", "1")
+import sys
+import json
+import time
+import random
+import itertools
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+
+import numpy as np
+import pygame
+import levels
+from levels import Input, PatrolGroup, Enemy, ProjectilePool, Cannon, Player, World, Block
+
+# ============================================================
+#          Benchmarks (run under the SDL dummy driver)
+# ============================================================
+# python bench.py                      -> run everything, write bench_results.json
+# python bench.py --save-baseline      -> also store the results as the baseline
+# python bench.py --baseline FILE      -> compare against FILE, exit 1 on regression
+# python bench.py --only cannon,draw   -> run a subset
+#
+# Every scenario is parameterized (level width, entity count) so the results
+# double as scaling curves: frame time vs. tiles, vs. cannonballs, etc.
+
+SEED = 1234
+RESULTS_FILE = "bench_results.json"
+BASELINE_FILE = "bench_baseline.json"
+REGRESSION_THRESHOLD = 1.15   # 15% slower than baseline fails
+
+LEVEL_COLUMNS = (25, 100, 400, 1600)
+LARGE_LEVEL_COLUMNS = 16000   # ~20k tiles, only for level loading
+LEVEL_DIR = levels.LEVEL_DIR   # the shipped levels; synthetic ones go to a temp dir
+ENTITY_COUNTS = (1, 10, 100, 1000)
+
+
+def measure(fn, number=20, repeat=7, setup=None):
+    # median/min milliseconds per call of fn over `repeat` batches of `number`
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) * 1000 / number)
+    return {"median_ms": statistics.median(times), "min_ms": min(times), "runs": repeat * number}
+
+
+# ---- Synthetic levels ----
+_level_dir = None
+
+def synthetic_level(columns, enemies=0, cannons=0, pursuers=0):
+    global _level_dir
+    if _level_dir is None:
+        _level_dir = tempfile.mkdtemp(prefix="panda_bench_")
+        levels.LEVEL_DIR = _level_dir
+        levels.LEVEL_CACHE_DIR = os.path.join(_level_dir, ".cache")
+    rng = random.Random(SEED + columns)
+    tile_ids = sorted(levels.tiles)
+    tilemap = [[0] * columns for _ in range(11)]
+    for col in range(columns):
+        tilemap[9][col] = tile_ids[0]
+        if rng.random() < 0.3:
+            tilemap[rng.choice((3, 5, 7))][col] = rng.choice(tile_ids)
+    name = f"bench_{columns}_{enemies}_{cannons}" + (f"_{pursuers}" if pursuers else "")
+    data = {
+        "background": "using assets/winter_bg.png",
+        "tile_size": [levels.TILE_W, levels.TILE_H],
+        "player": [10, 430],
+        "enemies": [[rng.randrange(150, columns * levels.TILE_W), 350] for _ in range(enemies)]
+                   + [[rng.randrange(150, columns * levels.TILE_W), 354, 10**6] for _ in range(pursuers)],
+        "cannons": [[rng.randrange(0, columns * levels.TILE_W), 400] for _ in range(cannons)],
+        "key": {"tile": [10, 8], "size": 32},
+        "door": None,
+        "tilemap": tilemap,
+    }
+    with open(os.path.join(_level_dir, name + ".json"), "w") as f:
+        json.dump(data, f)
+    return name
+
+
+def fresh_level_cache():
+    levels._compiled_levels.clear()
+
+
+# ---- Scenarios ----
+def bench_build_tilemap():
+    results = {}
+    for level in ("level1", "level2"):
+        with open(os.path.join(LEVEL_DIR, level + ".json")) as f:
+            tilemap = json.load(f)["tilemap"]
+        results[level] = measure(lambda: Block.build_tilemap(tilemap), number=5)
+    for columns in LEVEL_COLUMNS + (LARGE_LEVEL_COLUMNS,):
+        name = synthetic_level(columns)
+        # cold in-memory cache; the on-disk compiled cache stays warm
+        results[f"load_level/{columns}cols"] = measure(lambda: levels.load_level(name), number=1,
+                                                       setup=fresh_level_cache)
+    return results
+
+
+def bench_collision():
+    results = {}
+    for columns in LEVEL_COLUMNS:
+        level = levels.load_level(synthetic_level(columns))
+        player = Player(10, 466)
+        positions = [(x, 430) for x in range(0, columns * levels.TILE_W - 70, 37)][:200]
+        def run():
+            for pos in positions:
+                player.rect.topleft = pos
+                player.x_vel, player.y_vel = levels.PLAYER_VEL, 8
+                player.move(level.grid)
+        results[f"{columns}cols"] = measure(run, number=5)
+        results[f"{columns}cols"]["per_query_us"] = results[f"{columns}cols"]["median_ms"] * 1000 / len(positions)
+    return results
+
+
+def bench_cannon():
+    results = {}
+    player = Player(10, 466)
+    for count in ENTITY_COUNTS:
+        pool = ProjectilePool(count)
+        def setup():
+            pool.kill(pool.alive)
+            for i in range(count):
+                pool.spawn(100 + (i * 7) % 600, 300 + (i * 13) % 200, 6 if i % 2 else -6)
+            player.health = 1e9
+        # balls stay on screen for the measured window: 20 ticks * 6px
+        results[f"{count}balls"] = measure(lambda: pool.update(player, 10**6), number=20, setup=setup)
+        cannon = Cannon(650, 400)
+        results[f"{count}balls+fire"] = measure(
+            lambda: (cannon.update(player, pool, cannon.last_fired + cannon.fire_rate),
+                     pool.update(player, 10**6)), number=20, setup=setup)
+        # balls crossing a floor of tiles: broadphase on every tick, sweeps near walls
+        grid = levels.load_level(synthetic_level(100)).grid
+        results[f"{count}balls+tiles"] = measure(lambda: pool.update(player, 10**6, grid=grid),
+                                                 number=20, setup=setup)
+    return results
+
+
+def bench_patrols():
+    results = {}
+    player = Player(10, 466)
+    attack = pygame.Rect(50, 466, 50, 80)
+    for count in ENTITY_COUNTS:
+        group = PatrolGroup(count)
+        for i in range(count):
+            Enemy(150 + (i * 37) % 1200, 350, group)
+        player.health = 1e9
+        results[f"{count}enemies"] = measure(lambda: group.update(player, attack), number=50)
+    return results
+
+
+def bench_pursuit():
+    results = {}
+    for columns in LEVEL_COLUMNS:
+        name = synthetic_level(columns)
+        level = levels.load_level(name)
+        results[f"build_nav/{columns}cols"] = measure(lambda: levels.build_nav(
+            level.store.solid, np.zeros(level.store.ids.shape, np.int32), level.tile_w, level.tile_h), number=1)
+        results[f"build_nav/{columns}cols"]["spans"] = len(level.nav)
+    # the player hops between platforms so the chasers keep re-routing;
+    # routes come from the per-goal cache after the first visit
+    inputs = itertools.cycle(levels.scripted_input([(40, Input(False, True, True, False)),
+                                                    (40, Input(True, False, True, False))]))
+    for count in ENTITY_COUNTS:
+        world = World(synthetic_level(400, pursuers=count))
+        world.player.health = 1e9
+        results[f"{count}pursuers"] = measure(lambda: world.step(next(inputs)), number=100)
+    return results
+
+
+def bench_draw():
+    results = {}
+    surface = pygame.Surface((levels.WIDTH, levels.HEIGHT)).convert()
+    for columns in LEVEL_COLUMNS:
+        world = World(synthetic_level(columns, enemies=10, cannons=2))
+        for _ in range(120):
+            world.step(Input(False, True, False, False))
+        results[f"{columns}cols"] = measure(lambda: world.draw(surface, 0.5), number=10)
+    for count in ENTITY_COUNTS:
+        world = World(synthetic_level(25))
+        for i in range(count):
+            world.projectiles.spawn(20 + (i * 7) % 760, 100 + (i * 13) % 400, 0)
+        results[f"{count}balls"] = measure(lambda: world.draw(surface, 0.5), number=10)
+    return results
+
+
+def bench_step():
+    results = {}
+    for columns in LEVEL_COLUMNS:
+        world = World(synthetic_level(columns, enemies=10, cannons=2))
+        world.player.health = 1e9
+        results[f"{columns}cols"] = measure(lambda: world.step(Input(False, True, False, True)), number=100)
+    for count in ENTITY_COUNTS:
+        world = World(synthetic_level(100, enemies=count))
+        world.player.health = 1e9
+        results[f"{count}enemies"] = measure(lambda: world.step(Input(False, True, False, True)), number=100)
+    return results
+
+
+def bench_startup():
+    # fresh interpreter each run; assets resolve relative to the current directory.
+    # "import" is the bare module import, "first_menu" adds levels.start().
+    code = ("import sys, time; sys.path.insert(0, %r); t = time.perf_counter(); import levels; "
+            "i = time.perf_counter(); levels.start(); "
+            "print('startup_ms=%%f,%%f' %% ((i - t) * 1000, (time.perf_counter() - t) * 1000))"
+            % os.path.dirname(os.path.abspath(levels.__file__)))
+    env = dict(os.environ, PANDA_HEADLESS="1")
+    imports, firsts = [], []
+    for _ in range(5):
+        out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+        if out.returncode:
+            raise RuntimeError(out.stderr)
+        line = [l for l in out.stdout.splitlines() if l.startswith("startup_ms=")][-1]
+        import_ms, first_ms = map(float, line.split("=")[1].split(","))
+        imports.append(import_ms)
+        firsts.append(first_ms)
+    return {name: {"median_ms": statistics.median(times), "min_ms": min(times), "runs": len(times)}
+            for name, times in (("import", imports), ("first_menu", firsts))}
+
+
+SCENARIOS = {
+    "build_tilemap": bench_build_tilemap,
+    "collision": bench_collision,
+    "cannon": bench_cannon,
+    "patrols": bench_patrols,
+    "pursuit": bench_pursuit,
+    "draw": bench_draw,
+    "step": bench_step,
+    "startup": bench_startup,
+}
+
+
+# ---- Reporting ----
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    regressions = []
+    for scenario, cases in results.items():
+        for case, stats in cases.items():
+            base = baseline.get("results", {}).get(scenario, {}).get(case)
+            if not base:
+                continue
+            ratio = stats["median_ms"] / base["median_ms"] if base["median_ms"] else 1.0
+            flag = "REGRESSION" if ratio > threshold else ""
+            print(f"  {scenario:<14} {case:<22} {base['median_ms']:9.4f} -> {stats['median_ms']:9.4f} ms"
+                  f"  x{ratio:5.2f} {flag}")
+            if flag:
+                regressions.append((scenario, case, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Level simulation and rendering benchmarks.")
+    parser.add_argument("--only", help="comma separated scenario names")
+    parser.add_argument("--output", default=RESULTS_FILE)
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    random.seed(SEED)
+    levels.init_display()   # importing levels no longer sets up the display
+    names = args.only.split(",") if args.only else list(SCENARIOS)
+    results = {}
+    for name in names:
+        print(f"{name}...")
+        results[name] = SCENARIOS[name]()
+        for case, stats in results[name].items():
+            print(f"  {case:<24} {stats['median_ms']:9.4f} ms (min {stats['min_ms']:.4f})")
+
+    report = {
+        "meta": {"python": platform.python_version(), "pygame": pygame.version.ver,
+                 "machine": platform.machine(), "seed": SEED, "time": time.time()},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.save_baseline:
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {BASELINE_FILE}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.baseline}:")
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
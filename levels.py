@@ -1,44 +1,661 @@
+import time
+_import_started = time.perf_counter()
 import os
 import pygame
 from os.path import join
 import sys
-pygame.init()
+import json
+import hashlib
+import pickle
+import zlib
+import mmap
+from collections import OrderedDict, namedtuple
+import itertools
+import numpy as np
+import random
+import struct
+import threading
+import functools
+import weakref
+import heapq
+import math
+from contextlib import contextmanager
 # ---- Screen ----
 WIDTH, HEIGHT = 800, 600
 FPS = 60
+# Simulation tick rate. Physics, patrols and timers advance in fixed ticks;
+# FPS only caps rendering, which interpolates between the last two ticks.
+TICK_RATE = 60
+TICK_MS = 1000 / TICK_RATE
+MAX_FRAME_MS = 250   # clamp long stalls so the loop can't spiral
+DIRTY_RECTS = True   # only repaint/present what moved (see DirtyRenderer)
 PLAYER_WIDTH, PLAYER_HEIGHT = 70, 70
-PLAYER_VEL = 5
-window = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Platformer - Panda Player")
-# Fonts
-try:
-    font = pygame.font.SysFont("Times New Roman", 50)
-except Exception:
-    font = pygame.font.Font(None, 30)
-
+PLAYER_VEL = 10     # px per tick
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
 
+# ---- Startup ----
+# Importing this module does no I/O and opens no window: pygame, the
+# display, fonts and assets are brought up lazily on first use, and each of
+# those phases is timed so time-to-first-menu-frame can be watched.
+STARTUP_TARGET_MS = 500
+
+class StartupTimer:
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = []
+        self.ready_ms = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, (time.perf_counter() - start) * 1000))
+
+    def ready(self):
+        if self.ready_ms is None:
+            self.ready_ms = (time.perf_counter() - self.started) * 1000
+        return self.ready_ms
+
+    def report(self, target_ms=STARTUP_TARGET_MS):
+        print("startup:")
+        for name, ms in self.phases:
+            print(f"  {name:<22} {ms:8.1f} ms")
+        if self.ready_ms is not None:
+            verdict = "OK" if self.ready_ms <= target_ms else f"over the {target_ms} ms target"
+            print(f"  {'first menu frame':<22} {self.ready_ms:8.1f} ms  ({verdict})")
+
+startup = StartupTimer(_import_started)
+
+# ---- Settings ----
+# Options from the Settings menu, kept in SETTINGS_FILE. All game logic,
+# the camera and the HUD work in WIDTH x HEIGHT coordinates. "render" is
+# the size of the surface frames are actually drawn into: below WIDTH x
+# HEIGHT the game draws through a ScaledCanvas, so every blit and fill
+# touches fewer pixels, and the frame is scaled up to the window.
+# "resolution" is the window size. Upscaling happens on present(), on
+# the CPU (nearest scales only the dirty rects, smooth the whole frame)
+# or, with the hardware display on, by SDL's renderer on the GPU, which
+# is also what vsync needs. Headless runs ignore the file so results
+# don't depend on it.
+SETTINGS_FILE = "settings.json"
+RESOLUTIONS = ((800, 600), (1024, 768), (1280, 960), (1600, 1200))
+RENDER_RESOLUTIONS = ((400, 300), (560, 420), (640, 480), (800, 600))
+FPS_CAPS = (30, 60, 120, 0)   # 0 = uncapped
+SCALING = ("nearest", "smooth")
+SPRITE_SCALING = ("default", "nearest", "smooth")   # default: each loader's own filter
+DEFAULT_SETTINGS = {
+    "render": [WIDTH, HEIGHT],
+    "resolution": [WIDTH, HEIGHT],
+    "upscale": "nearest",
+    "fps": FPS,
+    "vsync": False,
+    "hardware": False,
+    "sprite_scaling": "default",
+}
+SETTING_CHOICES = {
+    "render": RENDER_RESOLUTIONS,
+    "resolution": RESOLUTIONS,
+    "upscale": SCALING,
+    "fps": FPS_CAPS,
+    "vsync": (False, True),
+    "hardware": (False, True),
+    "sprite_scaling": SPRITE_SCALING,
+}
+
+_settings = None
+
+def valid_setting(key, value):
+    # only what the menu itself can choose; bool is not accepted for an int
+    if key not in DEFAULT_SETTINGS or type(value) is not type(DEFAULT_SETTINGS[key]):
+        return False
+    return (tuple(value) if isinstance(value, list) else value) in SETTING_CHOICES[key]
+
+def get_settings():
+    global _settings
+    if _settings is None:
+        _settings = dict(DEFAULT_SETTINGS)
+        try:
+            with open(SETTINGS_FILE) as f:
+                saved = json.load(f)
+            for key, value in saved.items():
+                if valid_setting(key, value):
+                    _settings[key] = value
+                else:
+                    print(f"⚠️ Ignoring setting {key}={value!r} from {SETTINGS_FILE}")
+        except (OSError, ValueError, AttributeError):
+            pass
+    return _settings
+
+def save_settings():
+    try:
+        with open(SETTINGS_FILE, "w") as f:
+            json.dump(get_settings(), f, indent=2)
+    except OSError as e:
+        print(f"⚠️ Could not save settings: {e}")
+
+def active_settings():
+    return DEFAULT_SETTINGS if os.environ.get("PANDA_HEADLESS") else get_settings()
+
+def sprite_smooth(default):
+    scaling = active_settings()["sprite_scaling"]
+    return default if scaling == "default" else scaling == "smooth"
+
+# ---- Scaled canvas ----
+# Stands in for a WIDTH x HEIGHT surface while drawing into a smaller one.
+# Positions and rects are scaled on the way through; each image is scaled
+# the first time it is drawn and the copy kept for as long as the image
+# lives, so a frame costs blits of already-small sprites. Images must not
+# change after they have been drawn (HealthBar makes a new surface instead).
+class ScaledCanvas:
+    def __init__(self, surface, logical=(WIDTH, HEIGHT), scaled=None):
+        self.surface = surface
+        self.logical = logical
+        self.sx = surface.get_width() / logical[0]
+        self.sy = surface.get_height() / logical[1]
+        self._scaled = weakref.WeakKeyDictionary() if scaled is None else scaled
+
+    def get_size(self): return self.logical
+    def get_width(self): return self.logical[0]
+    def get_height(self): return self.logical[1]
+
+    def get_rect(self, **kwargs):
+        rect = pygame.Rect((0, 0), self.logical)
+        for name, value in kwargs.items():
+            setattr(rect, name, value)
+        return rect
+
+    def blank(self):
+        # an offscreen canvas of the same scale, sharing the scaled images
+        return ScaledCanvas(pygame.Surface(self.surface.get_size()).convert(), self.logical, self._scaled)
+
+    def to_real(self, rect):
+        # smallest surface rect covering a logical one
+        r = pygame.Rect(rect)
+        left, top = math.floor(r.x * self.sx), math.floor(r.y * self.sy)
+        return pygame.Rect(left, top, math.ceil(r.right * self.sx) - left, math.ceil(r.bottom * self.sy) - top)
+
+    def to_logical(self, rect):
+        left, top = math.floor(rect.x / self.sx), math.floor(rect.y / self.sy)
+        return pygame.Rect(left, top, math.ceil(rect.right / self.sx) - left, math.ceil(rect.bottom / self.sy) - top)
+
+    def image(self, source):
+        if isinstance(source, ScaledCanvas):
+            return source.surface
+        scaled = self._scaled.get(source)
+        if scaled is None:
+            w, h = source.get_size()
+            # rounded up, so neighbouring images (tile chunks) never leave a gap
+            size = (max(1, math.ceil(w * self.sx)), max(1, math.ceil(h * self.sy)))
+            smooth = sprite_smooth(True) and source.get_bitsize() >= 24 and source.get_colorkey() is None
+            scaled = self._scaled[source] = (pygame.transform.smoothscale if smooth else pygame.transform.scale)(source, size)
+        return scaled
+
+    def blit(self, source, dest, area=None, special_flags=0):
+        pos = (math.floor(dest[0] * self.sx), math.floor(dest[1] * self.sy))
+        area = self.to_real(area) if area is not None else None
+        return self.to_logical(self.surface.blit(self.image(source), pos, area, special_flags))
+
+    def blits(self, blit_sequence, doreturn=True):
+        rects = [self.blit(*item) for item in blit_sequence]
+        return rects if doreturn else None
+
+    def fill(self, color, rect=None, special_flags=0):
+        rect = self.to_real(rect) if rect is not None else None
+        return self.to_logical(self.surface.fill(color, rect, special_flags))
+
+_window = None
+_canvas = None
+
+def set_display_mode(size=None):
+    # (re)creates the window from the settings and the canvas drawn on: the
+    # window itself, an offscreen WIDTH x HEIGHT surface upscaled into a
+    # bigger window, or a ScaledCanvas over a smaller render surface
+    global _window, _canvas
+    settings = active_settings()
+    render = tuple(settings["render"]) if size is None else (WIDTH, HEIGHT)
+    _window = None
+    if settings["hardware"] and size is None:
+        flags = pygame.SCALED | pygame.DOUBLEBUF
+        # read by SDL when it makes the texture the canvas is scaled from
+        os.environ["SDL_RENDER_SCALE_QUALITY"] = "linear" if settings["upscale"] == "smooth" else "nearest"
+        for vsync in dict.fromkeys((int(settings["vsync"]), 0)):
+            try:
+                _window = pygame.display.set_mode(render, flags, vsync=vsync)
+                break
+            except pygame.error as e:
+                print(f"⚠️ Hardware display{' with vsync' if vsync else ''} unavailable: {e}")
+        if _window is not None:
+            _size_scaled_window(tuple(settings["resolution"]))
+    if _window is None:
+        _window = pygame.display.set_mode(size or tuple(settings["resolution"]))
+    target = _window if _window.get_size() == render else pygame.Surface(render).convert()
+    _canvas = target if render == (WIDTH, HEIGHT) else ScaledCanvas(target)
+    return _window
+
+def _size_scaled_window(size):
+    # SCALED picks its own window size; resize the OS window to the chosen
+    # resolution and SDL's renderer scales the canvas into it
+    try:
+        from pygame._sdl2.video import Window
+        Window.from_display_module().size = size
+    except (ImportError, AttributeError, pygame.error) as e:
+        print(f"⚠️ Could not size the hardware display to {size[0]}x{size[1]}: {e}")
+
+def init_display(size=None):
+    if _window is not None:
+        return _window
+    if os.environ.get("PANDA_HEADLESS"):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    with startup.phase("pygame.init"):
+        pygame.init()
+    with startup.phase("display"):
+        set_display_mode(size)
+        pygame.display.set_caption("Platformer - Panda Player")
+    with startup.phase("asset pack"):
+        assets.open_pack()
+    return _window
+
+def get_window():
+    return _window if _window is not None else init_display()
+
+def get_canvas():
+    # what everything is drawn on, in WIDTH x HEIGHT coordinates
+    init_display()
+    return _canvas
+
+def present(rects=None):
+    # shows the frame: partial updates when it was drawn into the window
+    # itself, otherwise the dirty rects (or everything) upscaled into it
+    surface = _canvas
+    if isinstance(_canvas, ScaledCanvas):
+        surface = _canvas.surface
+        if rects is not None:
+            rects = [_canvas.to_real(rect) for rect in rects if rect]
+    if surface is _window:
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+        return
+    size = _window.get_size()
+    smooth = active_settings()["upscale"] == "smooth"
+    if rects is None or smooth:
+        # smoothscale maps edge to edge, so a part scaled alone would not line up with the rest
+        (pygame.transform.smoothscale if smooth else pygame.transform.scale)(surface, size, _window)
+        pygame.display.flip()
+        return
+    # rects snap to blocks of qx x qy frame pixels that map onto exactly
+    # px x py window pixels, so each one scales the same as the whole frame
+    cw, ch = surface.get_size()
+    qx, qy = cw // math.gcd(cw, size[0]), ch // math.gcd(ch, size[1])
+    px, py = size[0] // math.gcd(cw, size[0]), size[1] // math.gcd(ch, size[1])
+    updated = []
+    for rect in rects:
+        rect = pygame.Rect(rect).clip(surface.get_rect()) if rect else None
+        if not rect:
+            continue
+        left, top = rect.x // qx, rect.y // qy
+        cols, rows = -(-rect.right // qx) - left, -(-rect.bottom // qy) - top
+        dest = pygame.Rect(left * px, top * py, cols * px, rows * py)
+        pygame.transform.scale(surface.subsurface(left * qx, top * qy, cols * qx, rows * qy),
+                               dest.size, _window.subsurface(dest))
+        updated.append(dest)
+    pygame.display.update(updated)
+
+# Font lookups scan the system font list, so the resolved file is remembered
+# across runs in FONT_CACHE_FILE and fonts are memoized per (name, size).
+FONT_CACHE_FILE = os.path.join("assets", ".font_cache.json")
+
+def _font_paths():
+    try:
+        with open(FONT_CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+@functools.lru_cache(maxsize=None)
+def get_font(name="Times New Roman", size=50):
+    if not pygame.font.get_init():
+        init_display()
+    with startup.phase(f"font {name}"):
+        try:
+            paths = _font_paths()
+            path = paths.get(name)
+            if path is None or (path and not os.path.exists(path)):
+                path = pygame.font.match_font(name) or ""
+                paths[name] = path
+                try:
+                    with open(FONT_CACHE_FILE, "w") as f:
+                        json.dump(paths, f)
+                except OSError:
+                    pass
+            return pygame.font.Font(path or None, size)
+        except Exception:
+            return pygame.font.Font(None, 30)
+
+# ---- Baked asset pack ----
+# `python levels.py --bake-assets` decodes and scales every image the menu
+# and the levels use and writes the results, already in display pixel
+# format, into one pack file: a small JSON index followed by raw BGRA
+# pixels. At runtime the pack is memory-mapped and per-pixel-alpha surfaces
+# are made straight on top of the mapping (opaque ones need one convert()).
+# Entries whose source file changed since the bake, or a pack baked for
+# another pixel format, are ignored and the sources are loaded instead.
+ASSET_PACK_FILE = os.path.join("assets", ".assets.pack")
+ASSET_PACK_ALIGN = 64
+
+class AssetPack:
+    MAGIC = b"PAPK"
+    VERSION = 1
+    HEADER = struct.Struct("<4sII")   # magic, version, index length
+
+    def __init__(self, path, index, buf):
+        self.path = path
+        self.entries = index["entries"]
+        self.data_start = index["data_start"]
+        self.buf = buf
+        self._fresh = {}
+
+    @staticmethod
+    def display_format():
+        probe = pygame.Surface((1, 1)).convert_alpha()
+        return [sys.byteorder, list(probe.get_masks())]
+
+    @classmethod
+    def open(cls, path):
+        try:
+            with open(path, "rb") as f:
+                magic, version, index_len = cls.HEADER.unpack(f.read(cls.HEADER.size))
+                if magic != cls.MAGIC or version != cls.VERSION:
+                    return None
+                index = json.loads(f.read(index_len))
+                if index.get("format") != cls.display_format():
+                    print(f"⚠️ {path} was baked for another pixel format, loading sources")
+                    return None
+                # private copy-on-write mapping: surfaces on top of it stay writable
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (OSError, ValueError, struct.error):
+            return None
+        if not cls.intact(index, len(buf)):
+            print(f"⚠️ {path} is damaged, loading sources")
+            buf.close()
+            return None
+        return cls(path, index, buf)
+
+    @staticmethod
+    def intact(index, size):
+        # every entry has its fields and its pixels lie inside the file
+        try:
+            room = size - index["data_start"]
+            for entry in index["entries"].values():
+                entry["source"], entry["alpha"], entry["list"]
+                for offset, w, h in entry["surfaces"]:
+                    if offset < 0 or w < 0 or h < 0 or offset + w * h * 4 > room:
+                        return False
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return False
+        return True
+
+    @staticmethod
+    def entry_key(key):
+        return json.dumps(key, default=repr)
+
+    @staticmethod
+    def source_stamp(path):
+        st = os.stat(path)
+        return [st.st_mtime_ns, st.st_size]
+
+    def fresh(self, key):
+        entry = self.entries.get(self.entry_key(key))
+        if entry is None:
+            return False
+        path = key[0]
+        if path not in self._fresh:
+            try:
+                self._fresh[path] = self.source_stamp(path) == entry["source"]
+            except OSError:
+                self._fresh[path] = False
+        return self._fresh[path]
+
+    def surface(self, offset, w, h, alpha):
+        start = self.data_start + offset
+        surf = pygame.image.frombuffer(memoryview(self.buf)[start:start + w * h * 4], (w, h), "BGRA")
+        return surf if alpha else surf.convert()
+
+    def get(self, key):
+        if not self.fresh(key):
+            return None
+        entry = self.entries[self.entry_key(key)]
+        surfaces = [self.surface(offset, w, h, entry["alpha"]) for offset, w, h in entry["surfaces"]]
+        return surfaces if entry["list"] else surfaces[0]
+
+    @classmethod
+    def write(cls, path, cache):
+        # cache: AssetManager key -> surface or list of surfaces
+        entries, blobs, offset = {}, [], 0
+        for key, value in cache.items():
+            surfaces = value if isinstance(value, list) else [value]
+            placed = []
+            for surf in surfaces:
+                data = pygame.image.tobytes(surf, "BGRA")
+                placed.append((offset, surf.get_width(), surf.get_height()))
+                pad = -len(data) % ASSET_PACK_ALIGN
+                blobs.append(data + bytes(pad))
+                offset += len(data) + pad
+            entries[cls.entry_key(key)] = {"source": cls.source_stamp(key[0]), "alpha": key[2] == "alpha",
+                                           "list": isinstance(value, list), "surfaces": placed}
+        index = {"format": cls.display_format(), "entries": entries, "data_start": 0}
+        # data_start depends on the index length, which depends on data_start
+        while True:
+            raw = json.dumps(index).encode()
+            start = cls.HEADER.size + len(raw)
+            start += -start % ASSET_PACK_ALIGN
+            if index["data_start"] == start:
+                break
+            index["data_start"] = start
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(raw)))
+            f.write(raw)
+            f.write(bytes(start - cls.HEADER.size - len(raw)))
+            for blob in blobs:
+                f.write(blob)
+        os.replace(tmp, path)
+        return offset
+
+# ---- Asset manager ----
+# Every surface goes through here: cached by (path, scale, pixel format),
+# shared between instances and evicted least-recently-used once the cache
+# grows past its memory budget.
+ASSET_BUDGET_BYTES = 64 * 1024 * 1024
+
+class AssetManager:
+    def __init__(self, budget_bytes=ASSET_BUDGET_BYTES, pack_path=ASSET_PACK_FILE):
+        self.budget_bytes = budget_bytes
+        self.cache = OrderedDict()   # key -> (value, bytes)
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.pack_path = pack_path
+        self.pack = None
+        self.pack_hits = 0
+
+    def open_pack(self):
+        if self.pack is None and self.pack_path:
+            self.pack = AssetPack.open(self.pack_path)
+        return self.pack
+
+    @staticmethod
+    def surface_bytes(surf):
+        return surf.get_pitch() * surf.get_height()
+
+    def _get(self, key):
+        entry = self.cache.get(key)
+        if entry is None:
+            self.misses += 1
+            baked = self.pack.get(key) if self.pack else None
+            if baked is not None:
+                self.pack_hits += 1
+                surfaces = baked if isinstance(baked, list) else [baked]
+                return self._put(key, baked, sum(self.surface_bytes(s) for s in surfaces))
+            return None
+        self.hits += 1
+        self.cache.move_to_end(key)
+        return entry[0]
+
+    def _put(self, key, value, size):
+        old = self.cache.pop(key, None)
+        if old is not None:
+            self.used_bytes -= old[1]
+        self.cache[key] = (value, size)
+        self.used_bytes += size
+        # never evict the entry that was just added
+        while self.used_bytes > self.budget_bytes and len(self.cache) > 1:
+            _, (_, freed) = self.cache.popitem(last=False)
+            self.used_bytes -= freed
+            self.evictions += 1
+        return value
+
+    def has_source(self, path, alpha=True):
+        key = (os.path.normpath(path), None, "alpha" if alpha else "opaque")
+        return key in self.cache or bool(self.pack and self.pack.fresh(key))
+
+    def source(self, path, alpha=True):
+        path = os.path.normpath(path)
+        fmt = "alpha" if alpha else "opaque"
+        key = (path, None, fmt)
+        surf = self._get(key)
+        if surf is None:
+            get_window()   # convert() needs a display mode
+            surf = pygame.image.load(path)
+            surf = surf.convert_alpha() if alpha else surf.convert()
+            self._put(key, surf, self.surface_bytes(surf))
+        return surf
+
+    def image(self, path, scale=None, alpha=True, smooth=False):
+        if not scale:
+            return self.source(path, alpha)
+        scale = tuple(scale)
+        fmt = "alpha" if alpha else "opaque"
+        key = (os.path.normpath(path), scale, fmt, smooth)
+        surf = self._get(key)
+        if surf is None:
+            src = self.source(path, alpha)
+            surf = pygame.transform.smoothscale(src, scale) if smooth else pygame.transform.scale(src, scale)
+            self._put(key, surf, self.surface_bytes(surf))
+        return surf
+
+    def frames(self, path, frame_count, scale, smooth=False):
+        scale = tuple(scale)
+        key = (os.path.normpath(path), scale, "alpha", "frames", frame_count, smooth)
+        frames = self._get(key)
+        if frames is None:
+            sheet = self.source(path)
+            sheet_width, sheet_height = sheet.get_size()
+            frame_width = sheet_width // frame_count
+            frames = []
+            for i in range(frame_count):
+                frame = sheet.subsurface(pygame.Rect(i*frame_width,0,frame_width,sheet_height))
+                frames.append(pygame.transform.smoothscale(frame, scale) if smooth else pygame.transform.scale(frame, scale))
+            self._put(key, frames, sum(self.surface_bytes(f) for f in frames))
+        return frames
+
+    def cached(self, key, build, size_of=None):
+        value = self._get(key)
+        if value is None:
+            value = build()
+            self._put(key, value, (size_of or self.surface_bytes)(value))
+        return value
+
+    def adopt(self, path, decoded, alpha=True):
+        # takes a surface decoded off the main thread; only the cheap
+        # pixel-format conversion happens here
+        path = os.path.normpath(path)
+        key = (path, None, "alpha" if alpha else "opaque")
+        if key not in self.cache:
+            get_window()
+            surf = decoded.convert_alpha() if alpha else decoded.convert()
+            self._put(key, surf, self.surface_bytes(surf))
+
+    def placeholder(self, size):
+        key = ("<missing>", tuple(size), "opaque")
+        surf = self._get(key)
+        if surf is None:
+            surf = pygame.Surface(size)
+            surf.fill((200, 200, 200))
+            self._put(key, surf, self.surface_bytes(surf))
+        return surf
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "pack_hits": self.pack_hits,
+            "used_bytes": self.used_bytes,
+            "budget_bytes": self.budget_bytes,
+        }
+
+    def report(self):
+        st = self.stats()
+        print(f"assets: {st['entries']} entries, {st['used_bytes']/1024/1024:.1f}/"
+              f"{st['budget_bytes']/1024/1024:.1f} MB, hits {st['hits']} misses {st['misses']} "
+              f"({st['hit_rate']:.0%}), evictions {st['evictions']}, from pack {st['pack_hits']}")
+
+assets = AssetManager()
+
 def safe_load_image(path, size=None):
     base_path = os.path.dirname(__file__)
     full_path = os.path.join(base_path, path)
     
     if not os.path.exists(full_path):
         print(f"⚠️ Missing image: {full_path}")
-        surf = pygame.Surface((WIDTH, HEIGHT))
-        surf.fill((200, 200, 200))
-        return surf
+        return assets.placeholder((WIDTH, HEIGHT))
     
-    image = pygame.image.load(full_path).convert()
-    if size:
-        image = pygame.transform.scale(image, size)
-    return image
-
-menu_bg = safe_load_image("assets/using assets/Menu_BG.png", (WIDTH, HEIGHT))
-
-def draw_text(text, x, y):
-    label = font.render(text, True, BLACK)
-    window.blit(label, (x, y))
+    return assets.image(full_path, size, alpha=False)
+
+def get_menu_bg():
+    return safe_load_image("assets/using assets/Menu_BG.png", (WIDTH, HEIGHT))
+
+# ---- Text & HUD cache ----
+# Rendered strings are memoized by (text, font, color) in the asset cache.
+def render_text(text, color=BLACK, text_font=None):
+    text_font = text_font or get_font()
+    return assets.cached(("text", text, text_font, color),
+                         lambda: text_font.render(text, True, color))
+
+def draw_text(text, x, y, surface=None):
+    return (surface or get_window()).blit(render_text(text), (x, y))
+
+# Health bars are only re-rendered when the filled width actually changes,
+# into a new surface so a ScaledCanvas never shows a stale scaled copy.
+class HealthBar:
+    def __init__(self, width, height, border=2):
+        self.width = width
+        self.height = height
+        self.border = border
+        self.surface = None
+        self.current_width = None
+
+    def render(self, health, max_health):
+        current_width = int(self.width * (health / max_health))
+        if current_width != self.current_width:
+            self.current_width = current_width
+            surf = self.surface = pygame.Surface((self.width, self.height))
+            surf.fill(RED)
+            pygame.draw.rect(surf, GREEN, (0, 0, current_width, self.height))
+            pygame.draw.rect(surf, BLACK, (0, 0, self.width, self.height), self.border)
+        return self.surface
+
+    def draw(self, surface, x, y, health, max_health):
+        return surface.blit(self.render(health, max_health), (x, y))
 
 
 
@@ -48,77 +665,86 @@ GREEN = (0, 255, 0)
 BLACK = (0, 0, 0)
 
 # ---- Helper functions ----
-def load_image(folder, name, scale_to=None):
-    path = os.path.join("assets", folder, name)
-    img = pygame.image.load(path).convert_alpha()
-    if scale_to:
-        img = pygame.transform.smoothscale(img, scale_to)
-    return img
-
-def load_frames(folder, filename, frame_count, scale=(80,80)):
-    path = os.path.join("assets", folder, filename)
-    sheet = pygame.image.load(path).convert_alpha()
-    sheet_width, sheet_height = sheet.get_size()
-    frame_width = sheet_width // frame_count
-    frames = []
-    for i in range(frame_count):
-        frame = sheet.subsurface(pygame.Rect(i*frame_width,0,frame_width,sheet_height))
-        frame = pygame.transform.scale(frame, scale)
-        frames.append(frame)
-    return frames
+def lerp(a, b, t):
+    return a + (b - a) * t
+
+# smooth=None follows the sprite scaling setting
+def load_image(folder, name, scale_to=None, smooth=None):
+    smooth = sprite_smooth(True) if smooth is None else smooth
+    return assets.image(os.path.join("assets", folder, name), scale_to, smooth=smooth)
+
+def load_frames(folder, filename, frame_count, scale=(80,80), smooth=None):
+    smooth = sprite_smooth(False) if smooth is None else smooth
+    return assets.frames(os.path.join("assets", folder, filename), frame_count, scale, smooth)
+
+# ---- Animation clips ----
+# Facing variants and collision masks are built once per clip so drawing and
+# collision only index into precomputed lists.
+class AnimationClip:
+    def __init__(self, frames):
+        self.right = list(frames)
+        self.left = [pygame.transform.flip(f, True, False) for f in self.right]
+        self.right_masks = [pygame.mask.from_surface(f) for f in self.right]
+        self.left_masks = [pygame.mask.from_surface(f) for f in self.left]
+
+    def __len__(self):
+        return len(self.right)
+
+    def frame(self, index, facing_left=False):
+        return self.left[index] if facing_left else self.right[index]
+
+    def mask(self, index, facing_left=False):
+        return self.left_masks[index] if facing_left else self.right_masks[index]
+
+    def byte_size(self):
+        return 2 * sum(AssetManager.surface_bytes(f) for f in self.right)
+
+def load_clip(folder, filename, frame_count, scale=(80,80)):
+    smooth = sprite_smooth(False)
+    key = ("clip", folder, filename, frame_count, tuple(scale), smooth)
+    return assets.cached(key, lambda: AnimationClip(load_frames(folder, filename, frame_count, scale, smooth)),
+                         AnimationClip.byte_size)
+
+def load_image_clip(folder, names, scale_to=None):
+    smooth = sprite_smooth(True)
+    key = ("clip", folder, tuple(names), tuple(scale_to) if scale_to else None, smooth)
+    return assets.cached(key, lambda: AnimationClip([load_image(folder, n, scale_to, smooth) for n in names]),
+                         AnimationClip.byte_size)
 
 # ---- Tilemap ----
 block_size = 64  
 TILE_SIZE = 32
-
-tiles = {
-    1: load_image("tiles","1.png"),
-    2: load_image("tiles","2.png"),
-    3: load_image("tiles","3.png"),
-    5: load_image("tiles","5.png"),
-    8: load_image("tiles","red_tiles.png"),
-    7: load_image("tiles","black_tiles.JPG "),
-    14: load_image("tiles","14.png"),
-    15: load_image("tiles","15.png"),
-    16: load_image("tiles","16.png"),
+TILE_W, TILE_H = 33, 56
+
+TILE_FILES = {
+    1: "1.png",
+    2: "2.png",
+    3: "3.png",
+    5: "5.png",
+    8: "red_tiles.png",
+    7: "black_tiles.JPG ",
+    14: "14.png",
+    15: "15.png",
+    16: "16.png",
 }
 
-TILEMAP01= [
-    [0]*25,
-    [0]*25,
-    [2,3,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,15,15,15,15,15,15],
-    [0]*25,
-    [0]*25,
-    [0,0,0,0,0,0,15,15,15,15,15,15,15,15,15,15,15,0,0,0,0,0,0,0,0],
-    [0]*25,
-    [0]*25,
-    [0]*25,
-    [0,0,0,14,2,2,2,2,2,2,2,2,2,2,2,2,2,2,2,2,2,2,2,2,2],
-    [2,2,2]+[0]*22
-]
-# --- LEVEL 2 TILEMAP (your beautiful staircase design) ---
-TILEMAP02 = [
-    [0]*25,
-    [0]*25,
-    [0]*25,
-    [0]*25,
-    [0]*25,
-    [0]*25,
-    [0]*25,
-    [0]*25,
-    [0]*25,
-    [0,0,0,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,],
-    [8,8,8]+[0]*22
-]
+_tiles = None
+
+def get_tiles():
+    global _tiles
+    if _tiles is None:
+        with startup.phase("tiles"):
+            _tiles = {tile_id: load_image("tiles", name) for tile_id, name in TILE_FILES.items()}
+    return _tiles
 
 # ---- Blocks ----
 class Object(pygame.sprite.Sprite):
-    def __init__(self,x,y,w,h,name=None):
+    def __init__(self,x,y,w,h,name=None,image=None,mask=None):
         super().__init__()
         self.rect = pygame.Rect(x,y,w,h)
-        self.image = pygame.Surface((w,h),pygame.SRCALPHA)
+        self.image = image if image is not None else pygame.Surface((w,h),pygame.SRCALPHA)
         self.name = name
-        self.mask = pygame.mask.from_surface(self.image)
+        self.mask = mask if mask is not None else pygame.mask.from_surface(self.image)
     def draw(self,win,offset_x):
         win.blit(self.image,(self.rect.x-offset_x,self.rect.y))
 
@@ -128,30 +754,10 @@ class Block(Object):
         self.image.fill((150,150,150))
         self.mask = pygame.mask.from_surface(self.image)
 
-    def build_tilemap_level1():
-        objects = []
-        tile_w = 33
-        tile_h = 56
-
-        for row_index, row in enumerate(TILEMAP01):
-            for col_index, tile_id in enumerate(row):
-                if tile_id == 0:
-                     continue
-                if tile_id in tiles:
-                    x = col_index * tile_w
-                    y = row_index * tile_h
-                    block = Object(x, y, tile_w, tile_h)
-                    block.image.blit(tiles[tile_id], (0, 0))
-                    block.mask = pygame.mask.from_surface(block.image)
-                    objects.append(block)
-        return objects
-    
-    def  build_tilemap_level2():
+    def build_tilemap(tilemap, tile_w=TILE_W, tile_h=TILE_H):
+        tiles = get_tiles()
         objects = []
-        tile_w = 33
-        tile_h = 56
-
-        for row_index, row in enumerate(TILEMAP02):
+        for row_index, row in enumerate(tilemap):
             for col_index, tile_id in enumerate(row):
                 if tile_id == 0:
                     continue
@@ -163,75 +769,693 @@ class Block(Object):
                     block.mask = pygame.mask.from_surface(block.image)
                     objects.append(block)
         return objects
+
+    def build_tilemap_level1():
+        return load_level("level1").objects
+
+    def build_tilemap_level2():
+        return load_level("level2").objects
+
+# ---- Level files ----
+# Levels live in assets/levels/<name>.json (tilemap, tile size and spawn
+# points). The tile id array and tile masks are compiled once into a
+# binary cache keyed by the file's content hash (and checked against the
+# tile images it was built from), together with the
+# navigation graph, and kept in memory so a restart after "dead" does not
+# rebuild anything. An enemy, tailung or wolf entry is [x, y], or
+# [x, y, pursue_distance] for one that chases the player across platforms
+# once it comes that close.
+LEVEL_DIR = os.path.join("assets", "levels")
+LEVEL_CACHE_DIR = os.path.join(LEVEL_DIR, ".cache")
+LEVEL_CACHE_VERSION = 4
+
+_compiled_levels = {}
+
+class Level:
+    def __init__(self, name, data, digest):
+        self.name = name
+        self.digest = digest
+        self.tile_w, self.tile_h = data.get("tile_size", (TILE_W, TILE_H))
+        self.tilemap = data["tilemap"]
+        self.background = data.get("background")
+        self.next = data.get("next")
+        self.player = tuple(data["player"])
+        self.tailung = [tuple(pos) for pos in data.get("tailung", [])]
+        self.wolf = [tuple(pos) for pos in data.get("wolf", [])]
+        self.enemies = [tuple(pos) for pos in data.get("enemies", [])]
+        self.cannons = [tuple(pos) for pos in data.get("cannons", [])]
+        key = data.get("key")
+        self.key_tile = tuple(key["tile"]) if key else None
+        self.key_size = key.get("size", TILE_SIZE) if key else TILE_SIZE
+        door = data.get("door")
+        self.door = pygame.Rect(door) if door else None
+        self.width = max(len(row) for row in self.tilemap) * self.tile_w
+        self.height = len(self.tilemap) * self.tile_h
+        self.store = None
+        self.grid = None
+        self.tile_layer = None
+        self.nav = None
+
+    @property
+    def objects(self):
+        # one Object per tile, built on request; the level itself only keeps ids
+        return self.store.objects()
+
+def _encode_mask(mask):
+    w, h = mask.get_size()
+    return bytes(mask.get_at((x, y)) for y in range(h) for x in range(w))
+
+def _decode_mask(data, size):
+    surf = pygame.image.frombytes(data, size, "P")
+    surf.set_colorkey(0)
+    return pygame.mask.from_surface(surf)
+
+def compile_level(level):
+    # (rows, cols) tile id array, one mask per distinct tile id and the navigation graph
+    tiles = get_tiles()
+    ids = np.zeros((len(level.tilemap), max(len(row) for row in level.tilemap)), np.int16)
+    for row_index, row in enumerate(level.tilemap):
+        ids[row_index, :len(row)] = row
+    ids[~np.isin(ids, list(tiles))] = 0
+    masks = {}
+    solid = np.zeros(int(ids.max()) + 1, bool)
+    tops = np.zeros(len(solid), np.int32)
+    for tile_id in np.unique(ids[ids != 0]).tolist():
+        surf = pygame.Surface((level.tile_w, level.tile_h), pygame.SRCALPHA)
+        surf.blit(tiles[tile_id], (0, 0))
+        mask = pygame.mask.from_surface(surf)
+        masks[tile_id] = zlib.compress(_encode_mask(mask))
+        rects = mask.get_bounding_rects()
+        if rects:
+            solid[tile_id] = True
+            tops[tile_id] = min(rect.top for rect in rects)
+    return {"version": LEVEL_CACHE_VERSION, "size": (level.tile_w, level.tile_h),
+            "ids": ids, "masks": masks, "tiles": tile_stamps(masks), "nav": build_nav(solid[ids], tops[ids], level.tile_w, level.tile_h)}
+
+def tile_stamps(tile_ids):
+    # mtime and size of each tile image; masks and nav are built from them
+    stamps = {}
+    for tile_id in tile_ids:
+        try:
+            stamps[tile_id] = AssetPack.source_stamp(os.path.join("assets", "tiles", TILE_FILES[tile_id]))
+        except OSError:
+            stamps[tile_id] = None
+    return stamps
+
+def _load_compiled(level):
+    path = os.path.join(LEVEL_CACHE_DIR, level.digest + ".bin")
+    try:
+        with open(path, "rb") as f:
+            compiled = pickle.load(f)
+        if (compiled.get("version") == LEVEL_CACHE_VERSION
+                and compiled["tiles"] == tile_stamps(compiled["tiles"])):
+            return compiled
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+    compiled = compile_level(level)
+    try:
+        os.makedirs(LEVEL_CACHE_DIR, exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump(compiled, f)
+    except OSError as e:
+        print(f"⚠️ Could not write level cache: {e}")
+    return compiled
+
+def build_tile_store(compiled):
+    tiles = get_tiles()
+    size = compiled["size"]
+    surfaces, masks = {}, {}
+    for tile_id, data in compiled["masks"].items():
+        surfaces[tile_id] = pygame.Surface(size, pygame.SRCALPHA)
+        surfaces[tile_id].blit(tiles[tile_id], (0, 0))
+        masks[tile_id] = _decode_mask(zlib.decompress(data), size)
+    return TileStore(compiled["ids"], size[0], size[1], surfaces, masks)
+
+def check_placement(level):
+    # spawn points and pickups that sit inside the level geometry
+    grid = level.grid
+    checks = [("player spawn", player_hit_bounds().move(level.player), 1)]
+    if level.key_tile:
+        key = pygame.Rect(level.key_tile[0] * level.key_size, level.key_tile[1] * level.key_size,
+                          level.key_size, level.key_size)
+        checks.append(("key", key, key.width * key.height))
+    if level.door:
+        checks.append(("door", level.door, level.door.width * level.door.height))
+    for what, rect, limit in checks:
+        # the key and door may be partly embedded; the spawn must be clear
+        if grid.overlap_area(rect) >= limit:
+            print(f"⚠️ {level.name}: {what} at {tuple(rect)} is inside the level geometry")
+
+def load_level(name):
+    path = os.path.join(LEVEL_DIR, name + ".json")
+    with open(path, "rb") as f:
+        raw = f.read()
+    digest = hashlib.sha1(raw).hexdigest()
+    if digest in _compiled_levels:
+        return _compiled_levels[digest]
+    level = Level(name, json.loads(raw), digest)
+    compiled = _load_compiled(level)
+    level.store = build_tile_store(compiled)
+    level.grid = TileGrid(level.store)
+    level.nav = NavGraph(*compiled["size"], **compiled["nav"])
+    level.tile_layer = TileLayer(level.store)
+    check_placement(level)
+    _compiled_levels[digest] = level
+    return level
+
+# ---- Tile store ----
+# Flyweight tilemap: a numpy array of tile ids plus one surface, mask and
+# solid box per distinct id, so memory and build time follow the number of
+# tile types rather than the number of tiles. An Object for a single tile
+# is only made when something asks for one (level.objects, grid queries).
+class TileStore:
+    def __init__(self, ids, tile_w, tile_h, surfaces, masks):
+        self.ids = ids              # (rows, cols) int16, 0 = empty
+        self.tile_w = tile_w
+        self.tile_h = tile_h
+        self.surfaces = surfaces    # tile id -> surface
+        self.masks = masks          # tile id -> mask
+        self.bounds = {}            # tile id -> opaque bounds inside the tile, or None
+        lookup = np.zeros(max(masks, default=0) + 1, bool)
+        for tile_id, mask in masks.items():
+            rects = mask.get_bounding_rects()
+            self.bounds[tile_id] = rects[0].unionall(rects[1:]) if rects else None
+            lookup[tile_id] = bool(rects)
+        self.solid = lookup[ids]    # (rows, cols) cells holding tile geometry
+        rows, cols = np.nonzero(ids)
+        self.width = int(cols.max() + 1) * tile_w if cols.size else 0
+        self.height = int(rows.max() + 1) * tile_h if rows.size else 0
+        # every tile's mask drawn into one level-sized collision mask; a run
+        # of fully opaque tiles along a row goes in as one filled rect
+        self.mask = pygame.mask.Mask((ids.shape[1] * tile_w, ids.shape[0] * tile_h))
+        full = {tile_id for tile_id, mask in masks.items() if mask.count() == tile_w * tile_h}
+        for row, line in enumerate(ids):
+            edges = np.flatnonzero(np.diff(line)) + 1
+            for start, end in zip([0] + edges.tolist(), edges.tolist() + [len(line)]):
+                tile_id = int(line[start])
+                if tile_id in full:
+                    run = pygame.mask.Mask(((end - start) * tile_w, tile_h), fill=True)
+                    self.mask.draw(run, (start * tile_w, row * tile_h))
+                elif tile_id:
+                    for col in range(start, end):
+                        self.mask.draw(masks[tile_id], (col * tile_w, row * tile_h))
+
+    def __len__(self):
+        return int(np.count_nonzero(self.ids))
+
+    def cells(self, col0, col1, row0, row1):
+        # (col, row, tile_id) of the non-empty cells in the range, clipped to the map
+        rows, cols = self.ids.shape
+        col0, row0 = max(col0, 0), max(row0, 0)
+        block = self.ids[row0:max(row1 + 1, 0), col0:max(col1 + 1, 0)]
+        for r, c in zip(*np.nonzero(block)):
+            yield col0 + int(c), row0 + int(r), int(block[r, c])
+
+    def solid_box(self, col, row, tile_id):
+        bounds = self.bounds[tile_id]
+        return bounds.move(col * self.tile_w, row * self.tile_h) if bounds else None
+
+    def object(self, col, row, tile_id=None):
+        tile_id = tile_id or int(self.ids[row, col])
+        obj = Object(col * self.tile_w, row * self.tile_h, self.tile_w, self.tile_h,
+                     image=self.surfaces[tile_id], mask=self.masks[tile_id])
+        obj.solid = self.solid_box(col, row, tile_id)
+        return obj
+
+    def objects(self):
+        rows, cols = self.ids.shape
+        return [self.object(*cell) for cell in self.cells(0, cols - 1, 0, rows - 1)]
+
+# ---- Tile collision grid ----
+# Answers rect queries from the tile store by looking only at the cells
+# under a rect instead of every tile in the level.
+#
+# Collision runs against the store's single level mask, so each test is
+# one native overlap call however many tiles there are. Movement is
+# swept: a box moves along x, then along y, and stops at the first level
+# pixel in the strip it sweeps through, so nothing tunnels through a tile
+# however far it moves in one tick.
+# time of impact in 0..1 of the move, normal, and the (col, row) of the tile
+# hit; store.object(*cell) makes a sprite for it if one is needed
+Contact = namedtuple("Contact", "time normal cell")
+
+@functools.lru_cache(maxsize=256)
+def _box_mask(size):
+    # filled mask used as the query shape; shared, never modified
+    return pygame.mask.Mask(size, fill=True)
+
+class TileGrid:
+    def __init__(self, store):
+        self.store = store
+        self.tile_w = store.tile_w
+        self.tile_h = store.tile_h
+
+    def cell_range(self, rect):
+        col0 = rect.left // self.tile_w
+        col1 = (rect.right - 1) // self.tile_w
+        row0 = rect.top // self.tile_h
+        row1 = (rect.bottom - 1) // self.tile_h
+        return col0, col1, row0, row1
+
+    def query(self, rect):
+        return [self.store.object(*cell) for cell in self.store.cells(*self.cell_range(rect))]
+
+    def collide_rect(self, rect):
+        # rect-only test for things without a mask (bosses, cannonballs)
+        return [obj for obj in self.query(rect) if obj.rect.colliderect(rect)]
+
+    def collide(self, sprite):
+        # pixel-perfect test for sprites carrying a mask (the player)
+        return [obj for obj in self.query(sprite.rect) if pygame.sprite.collide_mask(sprite, obj)]
+
+    def overlap(self, rect):
+        # first level pixel inside rect, or None
+        if rect.width <= 0 or rect.height <= 0:
+            return None
+        return self.store.mask.overlap(_box_mask(rect.size), rect.topleft)
+
+    def overlap_area(self, rect):
+        if rect.width <= 0 or rect.height <= 0:
+            return 0
+        return self.store.mask.overlap_area(_box_mask(rect.size), rect.topleft)
+
+    def _hit(self, rect):
+        # level pixels inside rect as a rect-sized mask, plus their bounds
+        hit = _box_mask(rect.size).overlap_mask(self.store.mask, (-rect.x, -rect.y))
+        rects = hit.get_bounding_rects()
+        return hit, rects[0].unionall(rects[1:]) if rects else None
+
+    def penetration(self, box):
+        # smallest (dx, dy) that moves box out of the level pixels it overlaps
+        if self.overlap(box) is None:
+            return 0, 0
+        _, r = self._hit(box)
+        pushes = [(r.right, 0), (r.left - box.width, 0), (0, r.bottom), (0, r.top - box.height)]
+        return min(pushes, key=lambda push: abs(push[0]) + abs(push[1]))
+
+    def sweep_axis(self, box, delta, axis):
+        # moves box by delta along x (axis 0) or y (axis 1); returns the
+        # moved box and the Contact that stopped it, if any. Only the strip
+        # ahead of the box is tested, so it can always move out of overlaps.
+        if not delta:
+            return box, None
+        sign = 1 if delta > 0 else -1
+        n = abs(delta)
+        if axis == 0:
+            strip = pygame.Rect(box.right if sign > 0 else box.left - n, box.top, n, box.height)
+        else:
+            strip = pygame.Rect(box.left, box.bottom if sign > 0 else box.top - n, box.width, n)
+        if self.overlap(strip) is None:
+            return box.move((delta, 0) if axis == 0 else (0, delta)), None
+        hit, bounds = self._hit(strip)
+        # first blocking line of pixels, and the tile that owns one of them
+        if axis == 0:
+            line = bounds.left if sign > 0 else bounds.right - 1
+            gap = bounds.left if sign > 0 else n - bounds.right
+            px, py = hit.overlap(_box_mask((1, strip.height)), (line, 0))
+        else:
+            line = bounds.top if sign > 0 else bounds.bottom - 1
+            gap = bounds.top if sign > 0 else n - bounds.bottom
+            px, py = hit.overlap(_box_mask((strip.width, 1)), (0, line))
+        cell = ((strip.x + px) // self.tile_w, (strip.y + py) // self.tile_h)
+        if axis == 0:
+            return box.move(gap * sign, 0), Contact(gap / n, (-sign, 0), cell)
+        return box.move(0, gap * sign), Contact(gap / n, (0, -sign), cell)
+
+    def sweep(self, box, dx, dy):
+        # x pass then y pass; returns the resolved box and its contacts
+        contacts = []
+        box, contact = self.sweep_axis(box, dx, 0)
+        if contact: contacts.append(contact)
+        box, contact = self.sweep_axis(box, dy, 1)
+        if contact: contacts.append(contact)
+        return box, contacts
+
+    def occupancy(self):
+        # rows x cols bool array of the cells holding tile geometry
+        return self.store.solid
+
+    def touches(self, left, top, right, bottom):
+        # vectorized broadphase: which of the boxes (numpy edge arrays)
+        # reach into a cell holding tile geometry
+        occ = self.occupancy()
+        found = np.zeros(len(left), bool)
+        if not occ.size or not len(left):
+            return found
+        col0 = (left // self.tile_w).astype(np.int64)
+        col1 = ((right - 1) // self.tile_w).astype(np.int64)
+        row0 = (top // self.tile_h).astype(np.int64)
+        row1 = ((bottom - 1) // self.tile_h).astype(np.int64)
+        rows, cols = occ.shape
+        for dc in range(int((col1 - col0).max()) + 1):
+            for dr in range(int((row1 - row0).max()) + 1):
+                col, row = col0 + dc, row0 + dr
+                inside = (col <= col1) & (row <= row1) & (col >= 0) & (col < cols) & (row >= 0) & (row < rows)
+                found[inside] |= occ[row[inside], col[inside]]
+        return found
+
+# ---- Navigation graph ----
+# Platform graph for enemies that chase the player between platforms.
+# Nodes are walkable spans: runs of solid cells along a row with nothing
+# solid on top. A span links to the first span below either edge (a drop)
+# and to spans at most NAV_JUMP_ROWS higher or across a gap of at most
+# NAV_JUMP_COLS (a jump). The graph is built with the compiled level and
+# cached alongside it. Routes are found on demand, one Dijkstra run per
+# destination span covering every start span, and kept, so a crowd of
+# chasers only costs a few array lookups per tick.
+NAV_JUMP_ROWS = 4
+NAV_JUMP_COLS = 4
+NAV_HOP_SPEED = 6   # px per tick along a jump or drop
+NAV_DROP, NAV_JUMP = 0, 1
+
+def build_nav(solid, tops, tile_w, tile_h):
+    # solid: (rows, cols) cells holding tile geometry; tops: y of the
+    # opaque top inside each cell. Returns the arrays NavGraph is made of.
+    rows, cols = solid.shape
+    surface = solid.copy()
+    surface[1:] &= ~solid[:-1]
+    span_id = np.full((rows, cols), -1, np.int32)
+    spans = []
+    for row in range(rows):
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], surface[row].view(np.int8), [0]))))
+        for c0, c1 in zip(edges[::2].tolist(), edges[1::2].tolist()):
+            span_id[row, c0:c1] = len(spans)
+            spans.append((row, c0, c1, row * tile_h + int(tops[row, c0:c1].min())))
+    spans = np.array(spans, np.int32).reshape(-1, 4)
+    # span under each cell: the first surface at or below it in its column
+    below = span_id.copy()
+    for row in range(rows - 2, -1, -1):
+        below[row] = np.where(span_id[row] >= 0, span_id[row], below[row + 1])
+
+    x0, x1, y = spans[:, 1] * tile_w, spans[:, 2] * tile_w, spans[:, 3]
+    half = tile_w // 2
+    links = []   # (from, to, kind, takeoff x, landing x); x is where the feet are
+    for a, (row, c0, c1, ay) in enumerate(spans.tolist()):
+        for col, takeoff in ((c0 - 1, x0[a]), (c1, x1[a])):
+            if 0 <= col < cols and row + 1 < rows and not solid[row, col]:
+                b = int(below[row + 1, col])
+                if b >= 0:
+                    links.append((a, b, NAV_DROP, takeoff, min(max(col * tile_w + half, x0[b]), x1[b])))
+        gap = np.maximum(x0 - x1[a], x0[a] - x1)
+        reach = (y >= ay - NAV_JUMP_ROWS * tile_h) & (gap <= NAV_JUMP_COLS * tile_w) & ((y < ay) | (gap > 0))
+        reach[a] = False
+        for b in np.flatnonzero(reach).tolist():
+            if x0[b] >= x1[a]:
+                takeoff, landing = x1[a] - half, x0[b] + half
+            elif x1[b] <= x0[a]:
+                takeoff, landing = x0[a] + half, x1[b] - half
+            elif x0[a] < x0[b]:   # up onto a platform overhead: go round its edge
+                takeoff, landing = x0[b] - half, x0[b] + half
+            elif x1[b] < x1[a]:
+                takeoff, landing = x1[b] + half, x1[b] - half
+            else:
+                takeoff = landing = (x0[a] + x1[a]) // 2
+            links.append((a, b, NAV_JUMP, takeoff, landing))
+    return {"spans": spans, "below": below, "links": np.array(links, np.int32).reshape(-1, 5)}
+
+class NavGraph:
+    def __init__(self, tile_w, tile_h, spans, below, links):
+        self.tile_w = tile_w
+        self.tile_h = tile_h
+        self.spans = spans   # (n, 4) int32: row, first col, end col, surface y
+        self.below = below   # (rows, cols) int32: span under each cell, -1 if none
+        self.links = links   # (m, 5) int32: from, to, kind, takeoff x, landing x
+        self.x0 = spans[:, 1] * tile_w
+        self.x1 = spans[:, 2] * tile_w
+        self.y = spans[:, 3]
+        self.frm = links[:, 0].tolist()
+        self.cost = (np.abs(links[:, 4] - links[:, 3]) + np.abs(self.y[links[:, 1]] - self.y[links[:, 0]])).tolist()
+        # links sorted by the span they arrive at; into[start[b]:start[b + 1]] arrive at b
+        order = np.argsort(links[:, 1], kind="stable")
+        self.into = order.tolist()
+        self.start = np.searchsorted(links[order, 1], np.arange(len(spans) + 1)).tolist()
+        self._routes = {}   # goal span -> first link from every span
+
+    def __len__(self):
+        return len(self.spans)
+
+    def span_at(self, x, y):
+        # span under the points (x, y), vectorized; -1 where there is none
+        rows, cols = self.below.shape
+        col = np.floor_divide(x, self.tile_w).astype(np.intp)
+        row = np.clip(np.floor_divide(y, self.tile_h), 0, rows - 1).astype(np.intp)
+        inside = (col >= 0) & (col < cols)
+        return np.where(inside, self.below[row, np.clip(col, 0, cols - 1)], -1)
+
+    def routes(self, goal):
+        # first link of the cheapest path from each span to goal, -1 if
+        # there is none (or the span is the goal)
+        first = self._routes.get(goal)
+        if first is None:
+            first = self._routes[goal] = self._search(goal)
+        return first
+
+    def route(self, start, goal):
+        return int(self.routes(goal)[start])
+
+    def _search(self, goal):
+        # Dijkstra backwards from goal; the link a span is reached through is its first hop
+        frm, cost, into, start = self.frm, self.cost, self.into, self.start
+        dist = [float("inf")] * len(self.spans)
+        dist[goal] = 0
+        first = np.full(len(self.spans), -1, np.int32)
+        heap = [(0, goal)]
+        while heap:
+            d, b = heapq.heappop(heap)
+            if d > dist[b]:
+                continue
+            for link in into[start[b]:start[b + 1]]:
+                a, nd = frm[link], d + cost[link]
+                if nd < dist[a]:
+                    dist[a] = nd
+                    first[a] = link
+                    heapq.heappush(heap, (nd, a))
+        return first
+
+# ---- Static tile layer ----
+# The tilemap never changes while a level runs, so it is baked into wide
+# chunk surfaces and only the chunks in view get blitted. Chunks are built
+# when the camera gets near them and released once it has moved on, so
+# memory follows the screen size rather than the level length.
+CHUNK_WIDTH = 512
+CHUNK_PREFETCH = 1   # chunks built ahead of the viewport on each side
+CHUNK_KEEP = 2       # chunks kept alive outside the viewport before release
+
+class TileLayer:
+    def __init__(self, store, chunk_width=CHUNK_WIDTH):
+        self.store = store
+        self.chunk_width = chunk_width
+        self.chunks = {}      # chunk index -> baked surface
+        self.height = store.height
+        self.width = store.width
+        # chunks with at least one tile in them
+        cols = np.flatnonzero(store.ids.any(axis=0))
+        first = cols * store.tile_w // chunk_width
+        last = ((cols + 1) * store.tile_w - 1) // chunk_width
+        self.filled = set(first.tolist()) | set(last.tolist())
+
+    def cell_columns(self, index):
+        chunk_x = index * self.chunk_width
+        return chunk_x // self.store.tile_w, (chunk_x + self.chunk_width - 1) // self.store.tile_w
+
+    def bake(self, index):
+        store = self.store
+        chunk_x = index * self.chunk_width
+        width = min(self.chunk_width, self.width - chunk_x)
+        surf = pygame.Surface((width, self.height), pygame.SRCALPHA)
+        col0, col1 = self.cell_columns(index)
+        surf.blits([(store.surfaces[tile_id], (col * store.tile_w - chunk_x, row * store.tile_h))
+                    for col, row, tile_id in store.cells(col0, col1, 0, store.ids.shape[0] - 1)], doreturn=False)
+        return surf.convert_alpha()
+
+    def stream(self, offset_x, view_width):
+        first = offset_x // self.chunk_width
+        last = (offset_x + view_width - 1) // self.chunk_width
+        for index in range(first - CHUNK_PREFETCH, last + CHUNK_PREFETCH + 1):
+            if index in self.filled and index not in self.chunks:
+                self.chunks[index] = self.bake(index)
+        for index in [i for i in self.chunks if i < first - CHUNK_KEEP or i > last + CHUNK_KEEP]:
+            del self.chunks[index]
+        return first, last
+
+    def draw(self, win, offset_x):
+        offset_x = int(offset_x)
+        first, last = self.stream(offset_x, win.get_width())
+        for index in range(first, last + 1):
+            surf = self.chunks.get(index)
+            if surf is not None:
+                win.blit(surf, (index * self.chunk_width - offset_x, 0))
+
+# ---- Camera ----
+# Follows the player horizontally, clamped to the level, and answers
+# visibility questions for culling.
+class Camera:
+    def __init__(self, view_width, level_width):
+        self.view_width = view_width
+        self.level_width = level_width
+        self.offset_x = 0
+
+    def follow(self, x, width):
+        target = int(x + width / 2 - self.view_width / 2)
+        self.offset_x = max(0, min(target, self.level_width - self.view_width))
+        return self.offset_x
+
+    def visible(self, x, width):
+        return x + width > self.offset_x and x < self.offset_x + self.view_width
+
+# ---- Projectiles ----
+# All cannonballs live in one pool of preallocated arrays with a free list;
+# movement, culling and the player hit test run as whole-array operations.
+class ProjectilePool:
+    SIZE = (16, 12)
+    _image = None
+
+    def __init__(self, capacity=256):
+        self.capacity = 0
+        self.x = np.zeros(0, np.float32)
+        self.y = np.zeros(0, np.float32)
+        self.vx = np.zeros(0, np.float32)
+        self.vy = np.zeros(0, np.float32)
+        self.prev_x = np.zeros(0, np.float32)
+        self.prev_y = np.zeros(0, np.float32)
+        self.alive = np.zeros(0, bool)
+        self.free = []
+        self._grow(capacity)
+
+    @classmethod
+    def image(cls):
+        # one sprite shared by every ball
+        if cls._image is None:
+            cls._image = pygame.Surface(cls.SIZE, pygame.SRCALPHA)
+            pygame.draw.circle(cls._image, (0, 0, 0), (8, 6), 6)
+        return cls._image
+
+    def _grow(self, extra):
+        old = self.capacity
+        for name in ("x", "y", "vx", "vy", "prev_x", "prev_y", "alive"):
+            arr = getattr(self, name)
+            setattr(self, name, np.concatenate((arr, np.zeros(extra, arr.dtype))))
+        self.capacity = old + extra
+        self.free.extend(range(self.capacity - 1, old - 1, -1))
+
+    def __len__(self):
+        return self.capacity - len(self.free)
+
+    def spawn(self, x, y, vx, vy=0.0):
+        if not self.free:
+            self._grow(self.capacity or 1)
+        i = self.free.pop()
+        self.x[i] = self.prev_x[i] = x
+        self.y[i] = self.prev_y[i] = y
+        self.vx[i] = vx
+        self.vy[i] = vy
+        self.alive[i] = True
+        return i
+
+    def kill(self, mask):
+        dead = np.flatnonzero(mask)
+        self.alive[dead] = False
+        self.free.extend(dead.tolist())
+
+    ARRAYS = ("x", "y", "vx", "vy", "prev_x", "prev_y", "alive")
+
+    def snapshot(self):
+        return tuple(getattr(self, name).copy() for name in self.ARRAYS) + (list(self.free),)
+
+    def restore(self, state):
+        for name, arr in zip(self.ARRAYS, state):
+            setattr(self, name, arr.copy())
+        self.free = list(state[-1])
+        self.capacity = len(self.x)
+
+    def spans(self):
+        # box covered by each ball's move this tick
+        w, h = self.SIZE
+        return (np.minimum(self.prev_x, self.x), np.minimum(self.prev_y, self.y),
+                np.maximum(self.prev_x, self.x) + w, np.maximum(self.prev_y, self.y) + h)
+
+    def update(self, player, bound_width, damage=0.5, grid=None):
+        if len(self.free) == self.capacity:
+            return
+        np.copyto(self.prev_x, self.x)
+        np.copyto(self.prev_y, self.y)
+        self.x += self.vx
+        self.y += self.vy
+
+        # Tiles: the grid's broadphase picks the few balls near geometry and
+        # only those get an exact sweep; a ball stops where it hits a tile
+        wall = np.zeros(self.capacity, bool)
+        if grid is not None:
+            live = np.flatnonzero(self.alive)
+            left, top, right, bottom = (a[live] for a in self.spans())
+            w, h = self.SIZE
+            for i in live[grid.touches(left, top, right, bottom)].tolist():
+                start = pygame.Rect(int(self.prev_x[i]), int(self.prev_y[i]), w, h)
+                box, contacts = grid.sweep(start, int(self.x[i]) - start.x, int(self.y[i]) - start.y)
+                if contacts:
+                    self.x[i] = self.prev_x[i] + (box.x - start.x)
+                    self.y[i] = self.prev_y[i] + (box.y - start.y)
+                    wall[i] = True
+
+        # Player: swept span against the player, so fast balls can't skip it
+        left, top, right, bottom = self.spans()
+        r = player.rect
+        hit = self.alive & (left < r.right) & (right > r.left) & (top < r.bottom) & (bottom > r.top)
+        hits = int(np.count_nonzero(hit))
+        if hits:
+            player.health -= damage * hits
+
+        # Remove used/out of the level
+        off = (self.x <= 0) | (self.x >= bound_width)
+        self.kill(self.alive & (hit | wall | off))
+
+    def draw(self, surface, alpha=1.0, offset_x=0):
+        view_right = offset_x + surface.get_width()
+        live = np.flatnonzero(self.alive & (self.x + self.SIZE[0] > offset_x) & (self.x < view_right))
+        if not live.size:
+            return []
+        image = self.image()
+        xs = self.prev_x[live] + (self.x[live] - self.prev_x[live]) * alpha - offset_x
+        ys = self.prev_y[live] + (self.y[live] - self.prev_y[live]) * alpha
+        return surface.blits([(image, (x, y)) for x, y in zip(xs.tolist(), ys.tolist())])
+
 class Cannon:
     def __init__(self, x, y, attack_range=300):
         self.width = 50
         self.height = 50
         self.rect = pygame.Rect(x, y, self.width, self.height)
-        self.image = pygame.transform.scale(
-            pygame.image.load("assets/using assets/cannon.png").convert_alpha(),
-            (self.width, self.height)
-        )
+        self.image = assets.image("assets/using assets/cannon.png", (self.width, self.height))
 
-        self.cannonballs = []
         self.last_fired = pygame.time.get_ticks()
         self.fire_rate = 1500          # ms between shots
         self.attack_range = attack_range   # vertical-only range check
 
-    class CannonBall:
-        def __init__(self, x, y, vel_x):
-            self.rect = pygame.Rect(x, y, 16, 12)
-            self.vel_x = vel_x
-            self.image = pygame.Surface((16, 12), pygame.SRCALPHA)
-            pygame.draw.circle(self.image, (0, 0, 0), (8, 6), 6)
-            self.used = False
-
-        def update(self):
-            self.rect.x += self.vel_x
-
-    def update(self, player):
+    # Fires into the shared ProjectilePool; the pool moves and culls the balls.
+    def update(self, player, pool, now=None):
         # Check vertical range ONLY
         if abs(player.rect.centery - self.rect.centery) > self.attack_range:
             return  # Player too high/low → do not fire
 
-        # Fire rate timing
-        now = pygame.time.get_ticks()
+        # Fire rate timing (simulation clock when driven by a World)
+        if now is None: now = pygame.time.get_ticks()
         if now - self.last_fired >= self.fire_rate:
             self.last_fired = now
             direction = -1 if self.rect.x > player.rect.x else 1
-            ball = Cannon.CannonBall(
-                self.rect.centerx,
-                self.rect.centery,
-                vel_x=6 * direction
-            )
-            self.cannonballs.append(ball)
+            pool.spawn(self.rect.centerx, self.rect.centery, 6 * direction)
 
-        # Update balls
-        for ball in self.cannonballs:
-            ball.update()
-            if player.rect.colliderect(ball.rect):
-                player.health -= 0.5
-                ball.used = True
-
-        # Remove used/out of screen
-        screen_width = pygame.display.get_surface().get_width()
-        self.cannonballs = [
-            b for b in self.cannonballs
-            if not b.used and 0 < b.rect.x < screen_width
-        ]
-
-    def draw(self, surface):
-        # Draw the cannon image
-        surface.blit(self.image, self.rect.topleft)
-
-        # Update and draw cannonballs
-        for ball in self.cannonballs:
-            surface.blit(ball.image, ball.rect.topleft)
+    def draw(self, surface, offset_x=0):
+        return surface.blit(self.image, (self.rect.x - offset_x, self.rect.y))
 
 
 
 # ---- Player ----  
 # (Everything unchanged)
+def player_hit_bounds():
+    # opaque bounds of the idle frame, relative to the sprite's top-left; what
+    # collides with the tiles. One fixed scaling so physics doesn't follow the sprite setting.
+    bounds=pygame.mask.from_surface(load_image("Po","idle.png",(PLAYER_WIDTH,PLAYER_HEIGHT),True)).get_bounding_rects()
+    return bounds[0].unionall(bounds[1:]) if bounds else pygame.Rect(0,0,PLAYER_WIDTH,PLAYER_HEIGHT)
+
 class Player(pygame.sprite.Sprite):
     GRAVITY = 1
     def __init__(self,x,y):
@@ -243,17 +1467,30 @@ class Player(pygame.sprite.Sprite):
         self.jump_count=0
         self.fall_count=0
         self.is_attacking=False
-        self.attack_frames=[load_image("Po",f"attack{i}.png",(PLAYER_WIDTH,PLAYER_HEIGHT)) for i in range(1,5)]
+        self.attack_clip=load_image_clip("Po",[f"attack{i}.png" for i in range(1,5)],(PLAYER_WIDTH,PLAYER_HEIGHT))
+        self.attack_frames=self.attack_clip.right
         self.attack_frame_index=0
         self.attack_cooldown=0
         self.attack_speed=5
         self.attack_timer=0
         self.health=10
         self.max_health=10
-        self.image=load_image("Po","idle.png",(PLAYER_WIDTH,PLAYER_HEIGHT))
-        self.mask = pygame.mask.from_surface(self.image)
+        self.idle_clip=load_image_clip("Po",["idle.png"],(PLAYER_WIDTH,PLAYER_HEIGHT))
+        self.image=self.idle_clip.frame(0)
+        self.mask=self.idle_clip.mask(0)
+        self.hit_bounds=player_hit_bounds()
         self.sprite=self.image
-
+        self.prev_pos=self.rect.topleft
+        self.health_bar=HealthBar(100,10)
+
+    # everything loop()/move()/update_sprite() change; sprite and mask are shared clip frames
+    STATE=("prev_pos","x_vel","y_vel","direction","jump_count","fall_count","is_attacking",
+           "attack_frame_index","attack_cooldown","attack_timer","health","max_health","sprite","mask")
+    def snapshot(self): return (self.rect.topleft,)+tuple(getattr(self,name) for name in self.STATE)
+    def restore(self,state):
+        self.rect.topleft=state[0]
+        for name,value in zip(self.STATE,state[1:]): setattr(self,name,value)
+    def save_prev(self): self.prev_pos=self.rect.topleft
     def move_left(self,vel): self.x_vel=-vel; self.direction="left"
     def move_right(self,vel): self.x_vel=vel; self.direction="right"
     def jump(self):
@@ -263,198 +1500,351 @@ class Player(pygame.sprite.Sprite):
     def attack(self):
         if self.attack_cooldown==0: self.is_attacking=True; self.attack_frame_index=0; self.attack_timer=0; self.attack_cooldown=30
     def stop_attack(self): self.is_attacking=False; self.attack_frame_index=0; self.attack_timer=0
+    def hitbox(self):
+        # opaque part of the idle frame; this is what collides with the tiles
+        return self.hit_bounds.move(self.rect.topleft)
+    def move(self,grid=None):
+        # swept move by this tick's velocity; returns the tile contacts
+        box=self.hitbox()
+        target=box.copy(); target.y+=self.y_vel   # Rect rounds the sub-pixel velocity
+        dx,dy=self.x_vel,target.y-box.y
+        if grid: box=box.move(grid.penetration(box))   # spawned or pushed into the level
+        box,contacts=grid.sweep(box,dx,dy) if grid else (box.move(dx,dy),[])
+        self.rect.topleft=(box.x-self.hit_bounds.x,box.y-self.hit_bounds.y)
+        for contact in contacts:
+            if contact.normal[1]<0: self.landed()
+            elif contact.normal[1]>0: self.hit_head()
+            else: self.x_vel=0
+        return contacts
     def loop(self,fps):
         self.y_vel+=min(1,(self.fall_count/fps)*self.GRAVITY)
-        self.rect.x+=self.x_vel
-        self.rect.y+=self.y_vel
         self.fall_count+=1
         if self.attack_cooldown>0: self.attack_cooldown-=1
         self.update_sprite()
-        self.mask=pygame.mask.from_surface(self.sprite)
     def update_sprite(self):
         if self.is_attacking:
-            frames=self.attack_frames
-            self.sprite=frames[self.attack_frame_index]
+            clip=self.attack_clip
+            self.sprite=clip.frame(self.attack_frame_index)
+            self.mask=clip.mask(self.attack_frame_index)
             self.attack_timer+=1
             if self.attack_timer>=self.attack_speed:
                 self.attack_timer=0
                 self.attack_frame_index+=1
-                if self.attack_frame_index>=len(frames): self.attack_frame_index=0
-        else: self.sprite=self.image
-    def draw(self,win,offset_x):
-        win.blit(self.sprite,(self.rect.x-offset_x,self.rect.y))
-        bar_width = 100
-        bar_height = 10
-        bar_x = self.rect.x - offset_x
-        bar_y = self.rect.y - 15
-        pygame.draw.rect(win, RED, (bar_x, bar_y, bar_width, bar_height))
-        current_width = int(bar_width * (self.health / self.max_health))
-        pygame.draw.rect(win, GREEN, (bar_x, bar_y, current_width, bar_height))
-        pygame.draw.rect(win, BLACK, (bar_x, bar_y, bar_width, bar_height), 2)
+                if self.attack_frame_index>=len(clip): self.attack_frame_index=0
+        else: self.sprite=self.image; self.mask=self.idle_clip.mask(0)
+    def draw(self,win,offset_x,alpha=1.0):
+        x = lerp(self.prev_pos[0], self.rect.x, alpha) - offset_x
+        y = lerp(self.prev_pos[1], self.rect.y, alpha)
+        dirty = win.blit(self.sprite,(x,y))
+        return dirty.union(self.health_bar.draw(win, x, y - 15, self.health, self.max_health))
+
+# -------------------------------
+# Patrol group
+# -------------------------------
+# Enemy, TaiLungBoss and WolfBoss all pace between min_x and max_x and
+# trade contact damage with the player; members with a pursue_distance
+# follow the player across platforms along the level's NavGraph once it
+# comes that close, and keep at it. Their state lives in one set of
+# arrays so a whole crowd is updated and hit-tested with a few NumPy
+# operations; the classes below are thin views that only know how to draw.
+class PatrolGroup:
+    FIELDS = {
+        "x": np.float32, "y": np.float32, "prev_x": np.float32, "prev_y": np.float32,
+        "speed": np.float32, "direction": np.int8, "min_x": np.float32, "max_x": np.float32,
+        "health": np.float32, "max_health": np.float32, "alive": bool,
+        # contact box (hurts the player) and hurt box (hit by the attack rect)
+        "hit_w": np.float32, "hit_h": np.float32, "inflate": np.float32, "contact_damage": np.float32,
+        "hurt_w": np.float32, "hurt_h": np.float32, "damage_taken": np.float32, "heal_on_kill": bool,
+        # TaiLung-style chasing: closes in by chase_speed once within chase_distance
+        "center_dx": np.float32, "chase_distance": np.float32, "chase_speed": np.float32, "mode": np.int8,
+        # pursuit: the link being jumped or dropped along, -1 when on a span
+        "pursue_distance": np.float32, "hop": np.int32,
+        "frame_index": np.int16, "frame_timer": np.int16, "frame_delay": np.int16,
+        "frame_count": np.int16, "walk_frame_reset": bool,
+    }
+    WALK, ATTACK, PURSUE = 0, 1, 2
+    CULL_WIDTH = 160
+
+    def __init__(self, capacity=16):
+        self.capacity = 0
+        self.count = 0
+        self.members = []
+        for name, dtype in self.FIELDS.items():
+            setattr(self, name, np.zeros(0, dtype))
+        self._grow(capacity)
+
+    def _grow(self, extra):
+        for name in self.FIELDS:
+            arr = getattr(self, name)
+            setattr(self, name, np.concatenate((arr, np.zeros(extra, arr.dtype))))
+        self.capacity += extra
+
+    def add(self, member, **stats):
+        if self.count == self.capacity:
+            self._grow(self.capacity or 1)
+        i = self.count
+        self.count += 1
+        stats.setdefault("chase_distance", -1)
+        stats.setdefault("pursue_distance", -1)
+        stats.setdefault("hop", -1)
+        stats.setdefault("frame_count", 1)
+        stats.setdefault("frame_delay", 1)
+        stats.setdefault("max_health", stats["health"])
+        for name, value in stats.items():
+            getattr(self, name)[i] = value
+        self.prev_x[i] = self.x[i]
+        self.prev_y[i] = self.y[i]
+        self.alive[i] = True
+        self.members.append(member)
+        return i
+
+    def __len__(self):
+        return self.count
+
+    # the fields update() changes; the rest is fixed when a member is added
+    STATE = ("x", "y", "prev_x", "prev_y", "direction", "health", "alive", "mode",
+             "frame_index", "frame_timer", "hop")
+
+    def snapshot(self):
+        n = self.count
+        return tuple(getattr(self, name)[:n].copy() for name in self.STATE)
+
+    def restore(self, state):
+        for name, arr in zip(self.STATE, state):
+            getattr(self, name)[:len(arr)] = arr
+
+    def update(self, player, attack_rect=None, nav=None):
+        n = self.count
+        if not n:
+            return
+        x, y, direction = self.x[:n], self.y[:n], self.direction[:n]
+        alive = self.alive[:n]
+        np.copyto(self.prev_x[:n], x)
+        np.copyto(self.prev_y[:n], y)
+
+        # Pursue, chase or walk
+        center = x + self.center_dx[:n]
+        player_center = player.rect.centerx
+        mode = self.mode[:n]
+        distance = np.abs(player_center - center)
+        pursue = alive & ((mode == self.PURSUE) | (distance <= self.pursue_distance[:n]))
+        chase = alive & ~pursue & (distance <= self.chase_distance[:n])
+        walk = alive & ~chase & ~pursue
+        mode[alive] = np.where(pursue[alive], self.PURSUE, np.where(chase[alive], self.ATTACK, self.WALK))
+
+        # Animation
+        timer = self.frame_timer[:n]
+        timer += alive
+        roll = alive & (timer >= self.frame_delay[:n])
+        timer[roll] = 0
+        frame = self.frame_index[:n]
+        reset = roll & walk & self.walk_frame_reset[:n]
+        advance = roll & ~reset
+        frame[advance] = (frame[advance] + 1) % self.frame_count[:n][advance]
+        frame[reset] = 0
+
+        # Movement (patrol)
+        x[walk] += self.speed[:n][walk] * direction[walk]
+        turn_left = walk & (x >= self.max_x[:n])
+        turn_right = walk & ~turn_left & (x <= self.min_x[:n])
+        direction[turn_left] = -1
+        direction[turn_right] = 1
+        left = chase & (player_center < center)
+        right = chase & ~left
+        x[left] -= self.chase_speed[:n][left]
+        x[right] += self.chase_speed[:n][right]
+        direction[left] = -1
+        direction[right] = 1
+        if pursue.any():
+            self.pursue(np.flatnonzero(pursue), player, nav)
+
+        # Integer boxes, the way pygame.Rect truncates positions
+        bx = x.astype(np.int32)
+        by = y.astype(np.int32)
+
+        # Attack hits
+        if attack_rect:
+            a = attack_rect
+            hurt = (alive & (bx < a.right) & (bx + self.hurt_w[:n] > a.left)
+                    & (by < a.bottom) & (by + self.hurt_h[:n] > a.top))
+            if hurt.any():
+                health = self.health[:n]
+                health[hurt] -= self.damage_taken[:n][hurt]
+                killed = hurt & (health <= 0)
+                health[killed] = 0
+                alive[killed] = False
+                if (killed & self.heal_on_kill[:n]).any():
+                    player.health = player.max_health
+
+        # Contact damage
+        r = player.rect
+        inflate = self.inflate[:n]
+        touch = (alive & (bx < r.right + inflate) & (bx + self.hit_w[:n] > r.left - inflate)
+                 & (by < r.bottom + inflate) & (by + self.hit_h[:n] > r.top - inflate))
+        if touch.any():
+            player.health = max(0, player.health - float(self.contact_damage[:n][touch].sum()))
+
+    def pursue(self, idx, player, nav):
+        # Members on a span walk toward the player, or toward the takeoff of
+        # the next link on the route to the player's span, then hop along
+        # the link to its landing. Without a graph they only walk.
+        x, y, hit_w, hit_h = self.x, self.y, self.hit_w, self.hit_h
+        box = player.hitbox()
+        if nav is not None:
+            hop = self.hop[idx]
+            hopping = hop >= 0
+            i, link = idx[hopping], hop[hopping]
+            dx = nav.links[link, 4] - (x[i] + hit_w[i] / 2)
+            dy = nav.y[nav.links[link, 1]] - (y[i] + hit_h[i])
+            dist = np.hypot(dx, dy)
+            step = np.minimum(dist, NAV_HOP_SPEED) / np.maximum(dist, 1e-6)
+            x[i] += dx * step
+            y[i] += dy * step
+            self.direction[i[dx != 0]] = np.sign(dx[dx != 0])
+            self.hop[i[dist <= NAV_HOP_SPEED]] = -1
+            idx = idx[~hopping]
+
+        feet = x[idx] + hit_w[idx] / 2
+        goal = np.full(len(idx), box.centerx, np.float32)
+        route = np.full(len(idx), -1, np.int32)
+        if nav is not None:
+            span = nav.span_at(feet, y[idx] + hit_h[idx])
+            target = int(nav.span_at(box.centerx, box.bottom))
+            on = span >= 0
+            if target >= 0:
+                route[on] = nav.routes(target)[span[on]]
+            leave = route >= 0
+            goal[leave] = nav.links[route[leave], 3]
+            # the route only leaves a span at a takeoff point
+            goal[on] = np.clip(goal[on], nav.x0[span[on]], nav.x1[span[on]])
+        dx = goal - feet
+        speed = self.speed[idx]
+        x[idx] += np.clip(dx, -speed, speed)
+        self.direction[idx[dx != 0]] = np.sign(dx[dx != 0])
+        takeoff = (route >= 0) & (np.abs(dx) <= speed)
+        self.hop[idx[takeoff]] = route[takeoff]
+
+    def draw(self, surface, alpha=1.0, offset_x=0):
+        # cull with a margin wide enough for the sprites and their health bars
+        n = self.count
+        x = self.x[:n]
+        visible = self.alive[:n] & (x + self.CULL_WIDTH > offset_x) & (x < offset_x + surface.get_width())
+        return [self.members[i].draw(surface, alpha, offset_x) for i in np.flatnonzero(visible)]
+
+class PatrolMember:
+    def __init__(self, group, **stats):
+        self.group = group if group is not None else PatrolGroup(1)
+        self.i = self.group.add(self, **stats)
+
+    def _field(name, cast):
+        def get(self): return cast(getattr(self.group, name)[self.i])
+        def set(self, value): getattr(self.group, name)[self.i] = value
+        return property(get, set)
+
+    x = _field("x", float)
+    y = _field("y", float)
+    direction = _field("direction", int)
+    min_x = _field("min_x", float)
+    max_x = _field("max_x", float)
+    health = _field("health", float)
+    max_health = _field("max_health", float)
+    alive = _field("alive", bool)
+    frame_index = _field("frame_index", int)
+    del _field
+
+    @property
+    def pos(self):
+        return [self.x, self.y]
+
+    def draw_pos(self, alpha):
+        g, i = self.group, self.i
+        return (float(g.prev_x[i] + (g.x[i] - g.prev_x[i]) * alpha),
+                float(g.prev_y[i] + (g.y[i] - g.prev_y[i]) * alpha))
+
+    def draw_health_bar(self, surface, bar_x, bar_y, bar_width, bar_height):
+        bar = self.__dict__.get("health_bar")
+        if bar is None:
+            bar = self.health_bar = HealthBar(bar_width, bar_height)
+        return bar.draw(surface, bar_x, bar_y, self.health, self.group.max_health[self.i])
 
 # -------------------------------
 # Enemy class - Lord Shen
 # -------------------------------
 
-class Enemy:
-    def __init__(self, x, y):
+class Enemy(PatrolMember):
+    def __init__(self, x, y, group=None, pursue_distance=-1):
         self.width = 68
         self.height = 150
 
-        # Correct usage of load_frames
-        self.frames = load_frames("using assets", "lordshen.png", 6, scale=(self.width, self.height))
+        self.clip = load_clip("using assets", "lordshen.png", 6, scale=(self.width, self.height))
+        self.frames = self.clip.right
 
-        self.rect = pygame.Rect(x, y, self.width, self.height)
+        super().__init__(group, x=x, y=y, speed=2, direction=1, min_x=x - 120, max_x=x + 120,
+                         health=8, hit_w=self.width, hit_h=self.height, inflate=20,
+                         contact_damage=0.03, hurt_w=self.width, hurt_h=self.height,
+                         damage_taken=0.3, frame_count=len(self.frames), frame_delay=12,
+                         pursue_distance=pursue_distance)
 
-        self.frame_index = 0
-        self.frame_timer = 0
-        self.frame_delay = 12
+    @property
+    def rect(self):
+        return pygame.Rect(int(self.x), int(self.y), self.width, self.height)
 
-        self.vx = 2
-        self.direction = 1  # 1 = right, -1 = left
-        self.min_x = x - 120
-        self.max_x = x + 120
+    def draw(self, surface, alpha=1.0, offset_x=0):
+        # Left-facing frames are pre-flipped in the clip
+        frame = self.clip.frame(self.frame_index, self.direction < 0)
+        x, y = self.draw_pos(alpha)
+        x -= offset_x
 
-        self.alive = True
-        self.health = 8
-        self.max_health = 8
-
-    def animate(self):
-        self.frame_timer += 1
-        if self.frame_timer >= self.frame_delay:
-            self.frame_index = (self.frame_index + 1) % len(self.frames)
-            self.frame_timer = 0
-
-    def update(self, player_rect):
-        if not self.alive:
-            return False
-
-        # Movement (patrol)
-        self.rect.x += self.vx * self.direction
-        if self.rect.x >= self.max_x:
-            self.direction = -1
-        elif self.rect.x <= self.min_x:
-            self.direction = 1
-
-        # Collision with the player
-        if self.rect.colliderect(player_rect.inflate(40, 40)):
-            return True
-
-        return False
-
-    def draw(self, surface):
-        frame = self.frames[self.frame_index]
-
-        # Flip if moving left
-        if self.direction < 0:
-            frame = pygame.transform.flip(frame, True, False)
-
-        surface.blit(frame, (self.rect.x, self.rect.y))
+        dirty = surface.blit(frame, (x, y))
 
         # Health bar
-        bar_width = self.width
-        bar_height = 8
-        bar_x = self.rect.x
-        bar_y = self.rect.y - 10
-
-        pygame.draw.rect(surface, (255, 0, 0), (bar_x, bar_y, bar_width, bar_height))
-        pygame.draw.rect(surface, (0, 255, 0),
-                         (bar_x, bar_y, int(bar_width * (self.health / self.max_health)), bar_height))
-        pygame.draw.rect(surface, (0, 0, 0), (bar_x, bar_y, bar_width, bar_height), 2)
+        return dirty.union(self.draw_health_bar(surface, x, y - 10, self.width, 8))
 
 # ---- Tai Lung Boss ----
-class TaiLungBoss:
-    def __init__(self,pos):
-        self.frames=load_frames("using assets","TaiLung.png",6,(85,155))
-        self.pos=list(pos)
-        self.speed=2; self.direction=1; self.min_x=150; self.max_x=600
-        self.health=8; self.max_health=8; self.alive=True
-        self.frame_index=0; self.frame_timer=0; self.frame_delay=10
-        self.mode="walk"; self.attack_distance=120; self.alpha=255
-    def update(self,player_rect,keys):
-        if not self.alive: return
-        player_center=player_rect.centerx; tai_center=self.pos[0]+75
-        distance=abs(player_center-tai_center)
-        self.mode="walk" if distance>self.attack_distance else "attack"
-        self.frame_timer+=1
-        if self.frame_timer>=self.frame_delay:
-            self.frame_timer=0
-            if self.mode=="walk": self.frame_index=0
-            else: self.frame_index=(self.frame_index+1)%len(self.frames)
-        if self.mode=="walk":
-            self.pos[0]+=self.speed*self.direction
-            if self.pos[0]>=self.max_x:self.direction=-1
-            elif self.pos[0]<=self.min_x:self.direction=1
-        else:
-            if player_center<tai_center: self.pos[0]-=0.1; self.direction=-1
-            else: self.pos[0]+=0.1; self.direction=1
-    def attack_player(self,player_rect,player):
-        if not self.alive: return
-        tai_rect=pygame.Rect(self.pos[0],self.pos[1],90,90)
-        if player_rect.colliderect(tai_rect):
-            player.health=max(0,player.health-0.005)
-    def take_damage(self,attack_rect,player):
-        if not self.alive: return
-        tai_rect=pygame.Rect(self.pos[0],self.pos[1],100,100)
-        if attack_rect and attack_rect.colliderect(tai_rect):
-            self.health-=0.2
-            if self.health<=0: self.health=0; self.alive=False; self.alpha=255; player.health=player.max_health
-    def draw(self,screen):
-        if not self.alive: return
-        frame=self.frames[self.frame_index]
-        if self.mode=="walk" and self.direction<0: frame=pygame.transform.flip(frame,True,False)
-        screen.blit(frame,self.pos)
+class TaiLungBoss(PatrolMember):
+    def __init__(self,pos,group=None,pursue_distance=-1):
+        self.clip=load_clip("using assets","TaiLung.png",6,(85,155)); self.frames=self.clip.right
+        self.alpha=255
+        super().__init__(group,x=pos[0],y=pos[1],speed=2,direction=1,min_x=150,max_x=600,health=8,
+                         hit_w=90,hit_h=90,contact_damage=0.005,hurt_w=100,hurt_h=100,damage_taken=0.2,
+                         heal_on_kill=True,center_dx=75,chase_distance=120,chase_speed=0.1,
+                         frame_count=len(self.frames),frame_delay=10,walk_frame_reset=True,
+                         pursue_distance=pursue_distance)
+    MODES={PatrolGroup.WALK:"walk",PatrolGroup.ATTACK:"attack",PatrolGroup.PURSUE:"pursue"}
+    @property
+    def mode(self): return self.MODES[int(self.group.mode[self.i])]
+    def draw(self,screen,alpha=1.0,offset_x=0):
+        if not self.alive: return None
+        # walking and pursuing face the way they move; the attack frames are drawn as they are
+        frame=self.clip.frame(self.frame_index,self.mode!="attack" and self.direction<0)
+        x,y=self.draw_pos(alpha); x-=offset_x
+        dirty=screen.blit(frame,(x,y))
         # Health bar
-        bar_width=60; bar_height=6; bar_x=self.pos[0]+20; bar_y=self.pos[1]-10
-        pygame.draw.rect(screen,RED,(bar_x,bar_y,bar_width,bar_height))
-        current_width=int(bar_width*(self.health/self.max_health))
-        pygame.draw.rect(screen,GREEN,(bar_x,bar_y,current_width,bar_height))
-        pygame.draw.rect(screen,BLACK,(bar_x,bar_y,bar_width,bar_height),2)
+        return dirty.union(self.draw_health_bar(screen,x+20,y-10,60,6))
 
 # ---- Wolf Boss ----
-class WolfBoss:
-    def __init__(self,pos):
-        self.frames=load_frames("using assets","WolfBOSS.png",2,(60,50))
-        self.pos=list(pos)
-        self.speed=1.5; self.direction=-1
-        self.min_x=self.pos[0] - 200
-        self.max_x=self.pos[0]-10
-        self.health=8; self.max_health=8; self.alive=True
-    def update(self,player_rect,keys):
-        if not self.alive: return
-        self.pos[0]+=self.speed*self.direction
-        if self.pos[0]<=self.min_x:self.direction=1
-        elif self.pos[0]>=self.max_x:self.direction=-1
-    def attack_player(self,player_rect,player):
-        if not self.alive: return
-        wolf_rect=pygame.Rect(self.pos[0],self.pos[1],60,50)
-        if player_rect.colliderect(wolf_rect): 
-            player.health=max(0,player.health-0.005)
-    def take_damage(self,attack_rect):
-        if not self.alive: return
-        wolf_rect=pygame.Rect(self.pos[0],self.pos[1],60,50)
-        if attack_rect and attack_rect.colliderect(wolf_rect):
-            self.health-=0.2
-            if self.health<=0:self.alive=False
-    def draw(self,screen):
-        if not self.alive: return
-        frame=self.frames[1] if self.direction>0 else self.frames[0]
-        screen.blit(frame,self.pos)
-        bar_width=60; bar_height=6; bar_x=self.pos[0]+10; bar_y=self.pos[1]-10
-        pygame.draw.rect(screen,RED,(bar_x,bar_y,bar_width,bar_height))
-        current_width=int(bar_width*(self.health/self.max_health))
-        pygame.draw.rect(screen,GREEN,(bar_x,bar_y,current_width,bar_height))
-        pygame.draw.rect(screen,BLACK,(bar_x,bar_y,bar_width,bar_height),2)
+class WolfBoss(PatrolMember):
+    def __init__(self,pos,group=None,pursue_distance=-1):
+        self.clip=load_clip("using assets","WolfBOSS.png",2,(60,50)); self.frames=self.clip.right
+        super().__init__(group,x=pos[0],y=pos[1],speed=1.5,direction=-1,min_x=pos[0]-200,max_x=pos[0]-10,
+                         health=8,hit_w=60,hit_h=50,contact_damage=0.005,hurt_w=60,hurt_h=50,damage_taken=0.2,
+                         pursue_distance=pursue_distance)
+    def draw(self,screen,alpha=1.0,offset_x=0):
+        if not self.alive: return None
+        frame=self.clip.frame(1 if self.direction>0 else 0)
+        x,y=self.draw_pos(alpha); x-=offset_x
+        dirty=screen.blit(frame,(x,y))
+        return dirty.union(self.draw_health_bar(screen,x+10,y-10,60,6))
 
 # ---- Key helpers ----  
 def create_key(image_path,tile_pos,tile_size):
-    key_img=pygame.image.load(image_path).convert_alpha()
-    key_img=pygame.transform.scale(key_img,(tile_size,tile_size))
+    key_img=assets.image(image_path,(tile_size,tile_size))
     key_rect=pygame.Rect(tile_pos[0]*tile_size,tile_pos[1]*tile_size,tile_size,tile_size)
     return {"image":key_img,"rect":key_rect,"collected":False}
 
-def draw_key(screen,key):
-    if not key["collected"]: screen.blit(key["image"],key["rect"])
+def draw_key(screen,key,offset_x=0):
+    if not key["collected"]: return screen.blit(key["image"],key["rect"].move(-offset_x,0))
+    return None
 
 def check_key_collision(key,player_rect):
     if not key["collected"] and player_rect.colliderect(key["rect"]): key["collected"]=True
@@ -463,207 +1853,758 @@ def check_key_collision(key,player_rect):
 
 
 # ============================================================
-#                           LEVEL 1
+#                        FRAME PROFILER
 # ============================================================
-def level1(window):
-    clock = pygame.time.Clock()
-    bg_image = load_image("using assets", "winter_bg.png", (WIDTH, HEIGHT))
+# Per-phase frame timings kept in a ring buffer. mark(phase) charges the
+# time since the previous mark to that phase, so phases hit several times in
+# one frame (one per simulation tick) accumulate. Disabled, every call is a
+# single attribute check.
+PROFILE_PHASES = ("input", "player", "collision", "patrols", "cannons", "logic", "draw", "present")
+PROFILE_FRAMES = 600
+
+class FrameProfiler:
+    def __init__(self, phases=PROFILE_PHASES, capacity=PROFILE_FRAMES, enabled=False):
+        self.phases = phases
+        self.index = {phase: i for i, phase in enumerate(phases)}
+        self.capacity = capacity
+        self.samples = np.zeros((capacity, len(phases)))   # ms per phase
+        self.starts = np.zeros(capacity)                    # frame start, s
+        self.frames = 0
+        self.row = 0
+        self.last = 0.0
+        self.enabled = enabled
+        self.overlay = False
+        self._overlay_surface = None
+        self._font = None
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        if self.overlay:
+            self.enabled = True
+
+    def begin_frame(self):
+        if not self.enabled: return
+        self.row = self.frames % self.capacity
+        self.samples[self.row] = 0
+        self.last = self.starts[self.row] = time.perf_counter()
+        self.frames += 1
+
+    def mark(self, phase):
+        if not self.enabled: return
+        now = time.perf_counter()
+        self.samples[self.row, self.index[phase]] += (now - self.last) * 1000
+        self.last = now
+
+    def recorded(self):
+        # rows in chronological order
+        count = min(self.frames, self.capacity)
+        order = np.arange(self.frames - count, self.frames) % self.capacity
+        return self.starts[order], self.samples[order]
+
+    def percentiles(self):
+        _, samples = self.recorded()
+        if not len(samples):
+            return {}
+        p50 = np.percentile(samples, 50, axis=0)
+        p99 = np.percentile(samples, 99, axis=0)
+        return {phase: (p50[i], p99[i]) for i, phase in enumerate(self.phases)}
+
+    def draw_overlay(self, surface):
+        if not self.overlay:
+            return None
+        # text is rebuilt a few times a second, not every frame
+        if self._overlay_surface is None or self.frames % 15 == 0:
+            if self._font is None:
+                self._font = pygame.font.Font(None, 20)
+            small = self._font
+            lines = [f"{'phase':<10} p50 ms  p99 ms"]
+            lines += [f"{phase:<10} {p50:6.2f}  {p99:6.2f}" for phase, (p50, p99) in self.percentiles().items()]
+            surf = pygame.Surface((190, 16 * len(lines) + 8))
+            surf.fill(BLACK)
+            for i, line in enumerate(lines):
+                surf.blit(small.render(line, True, WHITE), (6, 4 + 16 * i))
+            self._overlay_surface = surf
+        return surface.blit(self._overlay_surface, (surface.get_width() - self._overlay_surface.get_width() - 8, 8))
+
+    def export_json(self, path):
+        starts, samples = self.recorded()
+        frames = [dict(start=float(t), **{p: float(v) for p, v in zip(self.phases, row)})
+                  for t, row in zip(starts, samples)]
+        with open(path, "w") as f:
+            json.dump({"phases": list(self.phases), "frames": frames}, f)
+
+    def export_csv(self, path):
+        starts, samples = self.recorded()
+        with open(path, "w") as f:
+            f.write("start," + ",".join(self.phases) + "\n")
+            for t, row in zip(starts, samples):
+                f.write(f"{t:.6f}," + ",".join(f"{v:.4f}" for v in row) + "\n")
+
+    def export_chrome_trace(self, path):
+        # chrome://tracing / Perfetto; phases are laid end to end in each frame
+        starts, samples = self.recorded()
+        events = []
+        for frame, (t, row) in enumerate(zip(starts, samples)):
+            ts = t * 1e6
+            events.append({"name": "frame", "ph": "X", "ts": ts, "dur": row.sum() * 1000,
+                           "pid": 1, "tid": 1, "args": {"frame": frame}})
+            for phase, ms in zip(self.phases, row):
+                if ms:
+                    events.append({"name": phase, "ph": "X", "ts": ts, "dur": ms * 1000, "pid": 1, "tid": 2})
+                    ts += ms * 1000
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def export(self, basename="frame_profile"):
+        self.export_json(basename + ".json")
+        self.export_csv(basename + ".csv")
+        self.export_chrome_trace(basename + ".trace.json")
+        print(f"Profile written to {basename}.json/.csv/.trace.json")
+
+profiler = FrameProfiler(enabled=bool(os.environ.get("PANDA_PROFILE")))
+
+# ============================================================
+#                           INPUT
+# ============================================================
+Input = namedtuple("Input", "left right jump attack")
+NO_INPUT = Input(False, False, False, False)
 
-    player = Player(10, HEIGHT - PLAYER_HEIGHT - 64)
-    tailung = TaiLungBoss([150, HEIGHT - PLAYER_HEIGHT - 120])
-    wolf = WolfBoss([400, HEIGHT - PLAYER_HEIGHT - 285])
+def read_input(keys):
+    return Input(bool(keys[pygame.K_LEFT]), bool(keys[pygame.K_RIGHT]),
+                 bool(keys[pygame.K_SPACE]), bool(keys[pygame.K_a]))
 
-    key = create_key("assets/using assets/KEY.png", (10, 8), 32)  # visible position
-    door_closed = pygame.transform.scale(pygame.image.load("assets/using assets/prison_house.png"), (200, 200))
-    door_open = pygame.transform.scale(pygame.image.load("assets/using assets/prison_door-opened.png"), (200, 200))
-    door_rect = pygame.Rect(630, HEIGHT - 670, 80, 120)
-    door_opened = False
+def input_mask(inp):
+    return inp.left | inp.right << 1 | inp.jump << 2 | inp.attack << 3
 
-    objects = Block.build_tilemap_level1()   # Fixed call
+def input_from_mask(mask):
+    return Input(bool(mask & 1), bool(mask & 2), bool(mask & 4), bool(mask & 8))
 
-    offset_x = 0
-    run = True
+def scripted_input(segments):
+    # segments: [(frame_count, Input), ...] played back in order
+    for count, inp in segments:
+        for _ in range(count):
+            yield inp
 
-    while run:
-        clock.tick(FPS)
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                return "exit"
+# ============================================================
+#                        LEVEL WORLD
+# ============================================================
+# All per-frame game logic lives in World.step() so it can run without a
+# window; World.draw() is the only part that touches a surface.
+Snapshot = namedtuple("Snapshot", "level frame time_ms player patrols projectiles cannons "
+                                  "key_collected door_opened")
+
+class World:
+    def __init__(self, name, screen_width=WIDTH, profiler=profiler):
+        self.level = level = load_level(name)
+        self.profiler = profiler
+        self.screen_width = screen_width
+        self.bg_image = None
+        if level.background:
+            folder, filename = os.path.split(level.background)
+            self.bg_image = load_image(folder, filename, (WIDTH, HEIGHT))
+
+        self.player = Player(*level.player)
+        self.patrols = PatrolGroup()
+        self.tailungs = [TaiLungBoss(pos[:2], self.patrols, *pos[2:]) for pos in level.tailung]
+        self.wolves = [WolfBoss(pos[:2], self.patrols, *pos[2:]) for pos in level.wolf]
+        self.enemies = [Enemy(pos[0], pos[1], self.patrols, *pos[2:]) for pos in level.enemies]
+        self.cannons = [Cannon(*pos) for pos in level.cannons]
+        self.projectiles = ProjectilePool()
+        for cannon in self.cannons:
+            cannon.last_fired = 0
+
+        self.key = create_key("assets/using assets/KEY.png", level.key_tile, level.key_size) if level.key_tile else None
+        self.door_rect = level.door
+        if self.door_rect:
+            self.door_closed = assets.image("assets/using assets/prison_house.png", (200, 200))
+            self.door_open = assets.image("assets/using assets/prison_door-opened.png", (200, 200))
+        self.door_opened = False
+
+        self.camera = Camera(screen_width, level.width)
+        self.offset_x = 0
+        self.frame = 0
+        self.time_ms = 0.0
+
+    # Full simulation state: compact, copied, and restorable without
+    # touching any asset. Presentation (camera, profiler) is not included.
+    def snapshot(self):
+        return Snapshot(self.level.name, self.frame, self.time_ms, self.player.snapshot(),
+                        self.patrols.snapshot(), self.projectiles.snapshot(),
+                        tuple(cannon.last_fired for cannon in self.cannons),
+                        bool(self.key and self.key["collected"]), self.door_opened)
+
+    def restore(self, snap):
+        if snap.level != self.level.name:
+            raise ValueError(f"snapshot of {snap.level} restored into {self.level.name}")
+        self.frame = snap.frame
+        self.time_ms = snap.time_ms
+        self.player.restore(snap.player)
+        self.patrols.restore(snap.patrols)
+        self.projectiles.restore(snap.projectiles)
+        for cannon, last_fired in zip(self.cannons, snap.cannons):
+            cannon.last_fired = last_fired
+        if self.key:
+            self.key["collected"] = snap.key_collected
+        self.door_opened = snap.door_opened
+        self.update_camera()
+
+    def state_hash(self):
+        # 8-byte digest of the simulation state, used to catch replay desyncs
+        p = self.player
+        h = hashlib.blake2b(digest_size=8)
+        h.update(struct.pack("<iiffdiiii??d", p.rect.x, p.rect.y, p.x_vel, p.y_vel, p.health,
+                             p.jump_count, p.fall_count, p.attack_cooldown, p.attack_frame_index,
+                             p.is_attacking, self.door_opened, self.time_ms))
+        n = self.patrols.count
+        for name in ("x", "direction", "health", "alive", "frame_index"):
+            h.update(getattr(self.patrols, name)[:n].tobytes())
+        live = self.projectiles.alive
+        h.update(self.projectiles.x[live].tobytes())
+        h.update(self.projectiles.y[live].tobytes())
+        h.update(bytes([bool(self.key and self.key["collected"])]))
+        return h.digest()
+
+    # Advances the simulation by one fixed tick of TICK_MS.
+    def step(self, inp):
+        player = self.player
+        prof = self.profiler
+        player.save_prev()
+        self.frame += 1
+        self.time_ms += TICK_MS
 
-        keys = pygame.key.get_pressed()
         player.x_vel = 0
-        if keys[pygame.K_LEFT]:  player.move_left(PLAYER_VEL)
-        if keys[pygame.K_RIGHT]: player.move_right(PLAYER_VEL)
-        if keys[pygame.K_SPACE]: player.jump()
-        if keys[pygame.K_a]:     player.attack()
-        else:                    player.stop_attack()
-
-        # Player movement & physics
-        player.loop(FPS)
-        player.rect.x += player.x_vel
-
-        # Platform collision
-        for obj in objects:
-            if pygame.sprite.collide_mask(player, obj):
-                if player.y_vel > 0:
-                    player.rect.bottom = obj.rect.top
-                    player.landed()
-                elif player.y_vel < 0:
-                    player.rect.top = obj.rect.bottom
-                    player.hit_head()
-
-        # Update bosses (removed extra "keys" argument)
-        tailung.update(player.rect, keys)
-        wolf.update(player.rect, keys)
-
-        # Attack & damage
+        if inp.left:   player.move_left(PLAYER_VEL)
+        if inp.right:  player.move_right(PLAYER_VEL)
+        if inp.jump:   player.jump()
+        if inp.attack: player.attack()
+        else:          player.stop_attack()
+        prof.mark("input")
+
+        # Player physics
+        player.loop(TICK_RATE)
+        prof.mark("player")
+
+        # Swept movement against the tiles
+        player.move(self.level.grid)
+        prof.mark("collision")
+
+        # Bosses and enemies: patrol, attack hits and contact damage
         attack_rect = pygame.Rect(player.rect.x + 40, player.rect.y, 50, 80) if player.is_attacking else None
-        tailung.take_damage(attack_rect, player)
-        wolf.take_damage(attack_rect)
-        tailung.attack_player(player.rect, player)
-        wolf.attack_player(player.rect, player)
+        self.patrols.update(player, attack_rect, self.level.nav)
+        prof.mark("patrols")
+
+        # Cannons
+        for cannon in self.cannons:
+            cannon.update(player, self.projectiles, self.time_ms)
+        self.projectiles.update(player, self.level.width, grid=self.level.grid)
+        prof.mark("cannons")
 
         # Key & door
-        check_key_collision(key, player.rect)
-        if player.rect.colliderect(door_rect) and key["collected"]:
-            door_opened = True
-
-        # Drawing
-        window.blit(bg_image, (0, 0))
-        for obj in objects:
-            obj.draw(window, offset_x)
-        player.draw(window, offset_x)
-        tailung.draw(window)
-        wolf.draw(window)
-        draw_key(window, key)
-        window.blit(door_open if door_opened else door_closed, door_rect.topleft)
-
-        pygame.display.update()
+        key = self.key
+        if key:
+            check_key_collision(key, player.rect)
+        if self.door_rect and key and player.rect.colliderect(self.door_rect) and key["collected"]:
+            self.door_opened = True
+
+        prof.mark("logic")
 
         # Win / Lose
-        if door_opened and player.rect.colliderect(door_rect):
-            pygame.time.wait(1000)
+        if self.door_opened and player.rect.colliderect(self.door_rect):
             return "next"
         if player.health <= 0:
-            pygame.time.wait(1000)
             return "dead"
-
-    return "exit"
+        return None
+
+    # Moves the camera to the player's interpolated position for this frame.
+    def update_camera(self, alpha=1.0):
+        player = self.player
+        x = lerp(player.prev_pos[0], player.rect.x, alpha)
+        self.offset_x = self.camera.follow(x, player.rect.width)
+        return self.offset_x
+
+    # Everything that only changes with the camera or the door state.
+    def draw_static(self, surface):
+        offset_x = self.offset_x
+        camera = self.camera
+        if self.bg_image:
+            surface.blit(self.bg_image, (0, 0))
+        else:
+            surface.fill(WHITE)
+        self.level.tile_layer.draw(surface, offset_x)
+        for cannon in self.cannons:
+            if camera.visible(cannon.rect.x, cannon.width):
+                cannon.draw(surface, offset_x)
+        if self.door_rect and camera.visible(self.door_rect.x, 200):
+            door = self.door_open if self.door_opened else self.door_closed
+            surface.blit(door, (self.door_rect.x - offset_x, self.door_rect.y))
+
+    def static_key(self):
+        return (self.offset_x, self.door_opened)
+
+    # Moving things; returns the screen rects they touched.
+    def draw_sprites(self, window, alpha=1.0):
+        offset_x = self.offset_x
+        dirty = [self.player.draw(window, offset_x, alpha)]
+        dirty += self.patrols.draw(window, alpha, offset_x)
+        dirty += self.projectiles.draw(window, alpha, offset_x)
+        if self.key and self.camera.visible(self.key["rect"].x, self.key["rect"].width):
+            dirty.append(draw_key(window, self.key, offset_x))
+        dirty.append(self.profiler.draw_overlay(window))
+        return [r for r in dirty if r]
+
+    # alpha is how far the render time is between the previous and current tick
+    def draw(self, window, alpha=1.0):
+        self.update_camera(alpha)
+        self.draw_static(window)
+        return self.draw_sprites(window, alpha)
+
+# ---- Input recording & replay ----
+# A session is the level id, a seed and the per-tick input as a run-length
+# encoded stream of 4-bit key masks (LEFT, RIGHT, SPACE, A), plus a state
+# hash every hash_interval ticks so a replay can tell where it desynced.
+RECORD_DIR = os.environ.get("PANDA_RECORD")
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+class InputRecording:
+    MAGIC = b"PVRC"
+    VERSION = 1
+
+    def __init__(self, level, seed=0, hash_interval=60):
+        self.level = level
+        self.seed = seed
+        self.hash_interval = hash_interval
+        self.runs = []      # [mask, count]
+        self.hashes = {}    # frame -> state hash
+        self.frames = 0
+
+    def append(self, inp):
+        mask = input_mask(inp)
+        if self.runs and self.runs[-1][0] == mask:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([mask, 1])
+        self.frames += 1
+
+    def record(self, inp, world):
+        self.append(inp)
+        if world.frame % self.hash_interval == 0:
+            self.hashes[world.frame] = world.state_hash()
+
+    def inputs(self):
+        for mask, count in self.runs:
+            inp = input_from_mask(mask)
+            for _ in range(count):
+                yield inp
+
+    def to_bytes(self):
+        out = bytearray(self.MAGIC)
+        level = self.level.encode("utf-8")
+        out += struct.pack("<BIHB", self.VERSION, self.seed, self.hash_interval, len(level)) + level
+        _write_varint(out, len(self.runs))
+        for mask, count in self.runs:
+            out.append(mask)
+            _write_varint(out, count)
+        _write_varint(out, len(self.hashes))
+        for frame, digest in sorted(self.hashes.items()):
+            _write_varint(out, frame)
+            out += digest
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:4] != cls.MAGIC:
+            raise ValueError("not an input recording")
+        version, seed, hash_interval, level_len = struct.unpack_from("<BIHB", data, 4)
+        if version != cls.VERSION:
+            raise ValueError(f"unsupported recording version {version}")
+        pos = 4 + struct.calcsize("<BIHB")
+        rec = cls(data[pos:pos + level_len].decode("utf-8"), seed, hash_interval)
+        pos += level_len
+        run_count, pos = _read_varint(data, pos)
+        for _ in range(run_count):
+            mask = data[pos]
+            count, pos = _read_varint(data, pos + 1)
+            rec.runs.append([mask, count])
+            rec.frames += count
+        hash_count, pos = _read_varint(data, pos)
+        for _ in range(hash_count):
+            frame, pos = _read_varint(data, pos)
+            rec.hashes[frame] = bytes(data[pos:pos + 8])
+            pos += 8
+        return rec
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+def seed_simulation(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+# Feeds a recording back through a fresh World at uncapped speed. Returns the
+# result, the world and the frames whose state hash did not match.
+def replay(recording, check_hashes=True, render=False):
+    if not isinstance(recording, InputRecording):
+        recording = InputRecording.load(recording)
+    seed_simulation(recording.seed)
+    world = World(recording.level)
+    surface = pygame.Surface((WIDTH, HEIGHT)) if render else None
+    mismatches = []
+    result = None
+    for inp in recording.inputs():
+        result = world.step(inp)
+        if render:
+            world.draw(surface)
+        expected = recording.hashes.get(world.frame)
+        if check_hashes and expected is not None and expected != world.state_hash():
+            mismatches.append(world.frame)
+        if result:
+            break
+    return result, world, mismatches
+
+# ---- Dirty-rect rendering ----
+# Keeps a cached copy of the static layer and, each frame, only restores
+# and presents the regions the moving sprites covered last frame and this
+# frame. Any change to the static layer (camera, door) forces a full frame.
+class DirtyRenderer:
+    def __init__(self, size):
+        self.size = size
+        self.background = None
+        self.static_key = None
+        self.prev_rects = []
+
+    def render(self, world, window, alpha=1.0):
+        if self.background is None:
+            # at the window's scale when it is a ScaledCanvas
+            self.background = window.blank() if isinstance(window, ScaledCanvas) else pygame.Surface(self.size).convert()
+        world.update_camera(alpha)
+        key = world.static_key()
+        if key != self.static_key:
+            self.static_key = key
+            world.draw_static(self.background)
+            window.blit(self.background, (0, 0))
+            self.prev_rects = world.draw_sprites(window, alpha)
+            world.profiler.mark("draw")
+            present()
+            return
+        background = self.background
+        for rect in self.prev_rects:
+            window.blit(background, rect, rect)
+        rects = world.draw_sprites(window, alpha)
+        world.profiler.mark("draw")
+        present(self.prev_rects + rects)
+        self.prev_rects = rects
+
+# ---- Next-level preloading ----
+# While a level runs, a worker thread decodes the next level's images and
+# builds its tilemap. finish() then only converts the decoded surfaces to
+# the display format on the main thread, so the level starts without a hitch.
+def level_asset_paths(level):
+    ua = os.path.join("assets", "using assets")
+    paths = [os.path.join("assets", level.background)] if level.background else []
+    paths += [os.path.join("assets", "Po", name) for name in ["idle.png"] + [f"attack{i}.png" for i in range(1, 5)]]
+    if level.key_tile: paths.append(os.path.join(ua, "KEY.png"))
+    if level.door: paths += [os.path.join(ua, "prison_house.png"), os.path.join(ua, "prison_door-opened.png")]
+    if level.enemies: paths.append(os.path.join(ua, "lordshen.png"))
+    if level.tailung: paths.append(os.path.join(ua, "TaiLung.png"))
+    if level.wolf: paths.append(os.path.join(ua, "WolfBOSS.png"))
+    if level.cannons: paths.append(os.path.join(ua, "cannon.png"))
+    return paths
+
+_preloaders = {}
+
+class LevelPreloader:
+    def __init__(self, name):
+        self.name = name
+        self.decoded = {}
+        self.error = None
+        self.thread = threading.Thread(target=self._work, name=f"preload-{name}", daemon=True)
+        self.thread.start()
+
+    def _work(self):
+        try:
+            level = load_level(self.name)
+            for path in level_asset_paths(level):
+                if not assets.has_source(path):
+                    self.decoded[path] = pygame.image.load(path)
+        except Exception as e:   # surfaced by finish(); the level then loads normally
+            self.error = e
+
+    def finish(self):
+        self.thread.join()
+        if self.error:
+            print(f"⚠️ Preloading {self.name} failed: {self.error}")
+            return
+        for path, surf in self.decoded.items():
+            assets.adopt(path, surf)
+        self.decoded.clear()
+
+def preload_level(name):
+    if name and name not in _preloaders:
+        _preloaders[name] = LevelPreloader(name)
+
+def finish_preload(name):
+    preloader = _preloaders.pop(name, None)
+    if preloader:
+        preloader.finish()
 
 # ============================================================
-#                           LEVEL 2 
+#                        LEVEL RUNNER
 # ============================================================
-def level2(window):
+# Worlds stay alive between attempts: a retry restores the snapshot taken
+# when the level was first built instead of building everything again.
+_worlds = {}
+
+def get_world(name, screen_width=WIDTH):
+    # returns the world, reset to its start, and that start snapshot
+    level = load_level(name)
+    cached = _worlds.get(name)
+    if cached and cached[0].level is level and cached[0].screen_width == screen_width:
+        world, start = cached
+        world.restore(start)
+        return world, start
+    world = World(name, screen_width)
+    _worlds[name] = (world, world.snapshot())
+    return _worlds[name]
+
+# R restarts the level, F5 stores a checkpoint and F9 goes back to it.
+def play_level(window, name, dirty_rects=DIRTY_RECTS, record_dir=RECORD_DIR):
     clock = pygame.time.Clock()
-    bg_image = load_image("using assets", "red_sky.jpg", (WIDTH, HEIGHT))
-
-    player = Player(50, HEIGHT - PLAYER_HEIGHT - 64)
-    lord_shen = Enemy(300, HEIGHT - PLAYER_HEIGHT - 180)
-    cannon = Cannon(650, HEIGHT - 200)
-
-    key = create_key("assets/using assets/KEY.png", (5, 7), 32)
-
-
-    objects = Block.build_tilemap_level2()
-
-    offset_x = 0
-    run = True
-
-    while run:
-        clock.tick(FPS)
+    seed = random.randrange(2**32)
+    seed_simulation(seed)
+    finish_preload(name)
+    world, start = get_world(name, window.get_width())
+    checkpoint = None
+    preload_level(world.level.next)
+    recording = InputRecording(name, seed) if record_dir else None
+    renderer = DirtyRenderer(window.get_size()) if dirty_rects else None
+    fps = active_settings()["fps"]
+    clock.tick()
+    accumulator = 0.0
 
+    while True:
+        # Fixed-timestep loop: the simulation always advances in TICK_MS
+        # steps no matter how long the rendered frame took.
+        accumulator += min(clock.tick(fps), MAX_FRAME_MS)
+        profiler.begin_frame()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                if recording:
+                    save_recording(recording, record_dir)
                 return "exit"
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_F3: profiler.toggle_overlay()
+                elif event.key == pygame.K_F4: profiler.export()
+                elif event.key == pygame.K_r:
+                    world.restore(start)
+                    if recording:
+                        # a fresh attempt replays from a fresh world, so it gets its own file
+                        save_recording(recording, record_dir)
+                        recording = InputRecording(name, seed)
+                elif event.key == pygame.K_F5:
+                    checkpoint = world.snapshot()
+                elif event.key == pygame.K_F9 and checkpoint:
+                    world.restore(checkpoint)
+                    if recording:
+                        save_recording(recording, record_dir)
+                        print("Recording stopped: a checkpoint load can't be replayed from the level start")
+                        recording = None
+
+        inp = read_input(pygame.key.get_pressed())
+        profiler.mark("input")
+        result = None
+        while accumulator >= TICK_MS:
+            accumulator -= TICK_MS
+            result = world.step(inp)
+            if recording:
+                recording.record(inp, world)
+            if result:
+                accumulator = TICK_MS
+                break
+
+        if renderer:
+            renderer.render(world, window, accumulator / TICK_MS)
+        else:
+            world.draw(window, accumulator / TICK_MS)
+            profiler.mark("draw")
+            present()
+        profiler.mark("present")
+
+        if result:
+            if recording:
+                save_recording(recording, record_dir)
+            pygame.time.wait(1000)
+            return result
+
+def save_recording(recording, record_dir):
+    os.makedirs(record_dir, exist_ok=True)
+    path = os.path.join(record_dir, f"{recording.level}-{time.strftime('%Y%m%d-%H%M%S')}.pvrec")
+    recording.save(path)
+    print(f"Recorded {recording.frames} ticks to {path}")
+
+# Runs a level with no window and no frame cap. Needs SDL_VIDEODRIVER=dummy
+# (set PANDA_HEADLESS=1 before importing this module). Returns the result
+# ("next", "dead" or None when the inputs/frame budget ran out) and the world.
+# The returned world is reused (and reset) by the next run of the same level.
+def run_headless(name, inputs, max_frames=None, render=False):
+    world, _ = get_world(name)
+    surface = pygame.Surface((WIDTH, HEIGHT)) if render else None
+    for inp in inputs:
+        result = world.step(inp)
+        if render:
+            world.draw(surface)
+        if result:
+            return result, world
+        if max_frames and world.frame >= max_frames:
+            break
+    return None, world
 
-        keys = pygame.key.get_pressed()
-        player.x_vel = 0
-
-        if keys[pygame.K_LEFT]:  player.move_left(PLAYER_VEL)
-        if keys[pygame.K_RIGHT]: player.move_right(PLAYER_VEL)
-        if keys[pygame.K_SPACE]: player.jump()
-        if keys[pygame.K_a]:     player.attack()
-        else:                    player.stop_attack()
-
-        player.loop(FPS)
-        player.rect.x += player.x_vel
-
-        # Platform collision
-        for obj in objects:
-            if pygame.sprite.collide_mask(player, obj):
-                if player.y_vel > 0:
-                    player.rect.bottom = obj.rect.top
-                    player.landed()
-                elif player.y_vel < 0:
-                    player.rect.top = obj.rect.bottom
-                    player.hit_head()
-
-        # Lord Shen update
-        if lord_shen.alive:
-            lord_shen.animate()
-            if lord_shen.update(player.rect):
-                player.health -= 0.03
-
-        # Cannon
-        cannon.update(player)
-
-        # Attack hit on Lord Shen
-        attack_rect = pygame.Rect(player.rect.x + 40, player.rect.y, 50, 80) if player.is_attacking else None
-        if attack_rect and lord_shen.alive:
-            if attack_rect.colliderect(lord_shen.rect):
-                lord_shen.health -= 0.3
-                if lord_shen.health <= 0:
-                    lord_shen.alive = False
-
-        # Key (still working)
-        check_key_collision(key, player.rect)
-
-
-        # Drawing
-        window.blit(bg_image, (0, 0))
-
-        for obj in objects:
-            obj.draw(window, offset_x)
-
-        player.draw(window, offset_x)
-
-        if lord_shen.alive:
-            lord_shen.draw(window)
-
-        cannon.draw(window)
-        draw_key(window, key)
+def level1(window):
+    return play_level(window, "level1")
 
-        # Removed drawing of door
+def level2(window):
+    return play_level(window, "level2")
 
-        pygame.display.update()
 
-        # Removed next-level condition (door collision)
+# ============================================================
+#                           Main Menu
+# ============================================================
 
-        if player.health <= 0:
-            pygame.time.wait(1000)
-            return "dead"
+def compose_menu():
+    surface = get_menu_bg().copy()
+    draw_text("Kung Fu Game", 250, 150, surface)
+    draw_text("1. Start Game", 230, 230, surface)
+    draw_text("2. Settings", 230, 330, surface)
+    draw_text("3. Exit", 230, 430, surface)
+    return surface
+
+# ---- Settings menu ----
+SETTINGS_ITEMS = tuple((key, label, SETTING_CHOICES[key]) for key, label in (
+    ("render", "Render resolution"),
+    ("resolution", "Window size"),
+    ("upscale", "Upscaling"),
+    ("fps", "Frame cap"),
+    ("vsync", "VSync"),
+    ("hardware", "Hardware display"),
+    ("sprite_scaling", "Sprite scaling"),
+))
+SETTINGS_HINTS = {
+    "render": "Lower draws fewer pixels per frame; it is scaled up to the window",
+    "resolution": "Size of the window the frame is scaled to",
+    "upscale": "nearest is cheaper: smooth rescales the whole frame each time",
+    "fps": "A lower cap saves the most CPU time per second",
+    "hardware": "Upscales on the GPU; needed for VSync",
+    "sprite_scaling": "default keeps each sprite's usual filter",
+}
 
-    return "exit"
+def settings_label(key, value):
+    if key in ("render", "resolution"): return f"{value[0]}x{value[1]}"
+    if key == "fps": return f"{value} FPS" if value else "uncapped"
+    if isinstance(value, bool): return "on" if value else "off"
+    return value
+
+def cycle_setting(key, choices, step):
+    settings = get_settings()
+    value = settings[key]
+    current = [list(c) if isinstance(c, tuple) else c for c in choices]
+    index = current.index(value) if value in current else 0
+    settings[key] = current[(index + step) % len(current)]
+
+def apply_settings(before):
+    settings = get_settings()
+    # with the hardware display the upscale filter is chosen when the window is made
+    keys = ("render", "resolution", "hardware", "vsync") + (("upscale",) if settings["hardware"] else ())
+    if any(settings[k] != before[k] for k in keys):
+        set_display_mode()
+    if settings["sprite_scaling"] != before["sprite_scaling"]:
+        _worlds.clear()   # their sprites were scaled the old way
+
+# Up/Down picks an option, Left/Right changes it, Esc saves, applies and goes back.
+def settings_menu():
+    clock = pygame.time.Clock()
+    settings = get_settings()
+    before = dict(settings)
+    selected = 0
+    small = get_font(size=32)
+    while True:
+        canvas = get_canvas()
+        canvas.blit(get_menu_bg(), (0, 0))
+        draw_text("Settings", 300, 40, canvas)
+        for i, (key, label, _) in enumerate(SETTINGS_ITEMS):
+            color = RED if i == selected else BLACK
+            text = render_text(f"{label}: {settings_label(key, settings[key])}", color, small)
+            canvas.blit(text, (120, 130 + i * 45))
+        hint = "Up/Down select, Left/Right change, Esc save and back"
+        canvas.blit(render_text(hint, BLACK, get_font(size=24)), (120, 470))
+        note = SETTINGS_HINTS.get(SETTINGS_ITEMS[selected][0])
+        if note:
+            canvas.blit(render_text(note, BLACK, get_font(size=24)), (120, 500))
+        if settings["vsync"] and not settings["hardware"]:
+            canvas.blit(render_text("VSync needs the hardware display", RED, get_font(size=24)), (120, 530))
+        present()
 
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                sys.exit()
+            if event.type == pygame.KEYDOWN:
+                key, _, choices = SETTINGS_ITEMS[selected]
+                if event.key == pygame.K_ESCAPE:
+                    save_settings()
+                    apply_settings(before)
+                    return
+                elif event.key == pygame.K_UP: selected = (selected - 1) % len(SETTINGS_ITEMS)
+                elif event.key == pygame.K_DOWN: selected = (selected + 1) % len(SETTINGS_ITEMS)
+                elif event.key in (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_RETURN):
+                    cycle_setting(key, choices, -1 if event.key == pygame.K_LEFT else 1)
+        clock.tick(30)
 
-# ============================================================
-#                           Main Menu
-# ============================================================
+# Everything needed before the first menu frame.
+def start():
+    init_display()
+    with startup.phase("menu"):
+        menu = compose_menu()
+    return get_canvas(), menu
 
 def main_menu():
     clock = pygame.time.Clock()
+    window, menu = start()
+    redraw = True
     
     while True:
-        window.blit(menu_bg, (0, 0))
-
-        draw_text("Kung Fu Game", 250, 150)
-        draw_text("1. Start Game", 230, 230)
-        draw_text("2. Settings", 230, 330)
-        draw_text("3. Exit", 230, 430)
-
-        pygame.display.flip()
+        # The menu is static: only repaint after input or coming back from a level
+        if redraw:
+            window = get_canvas()   # settings may have replaced it
+            window.blit(menu, (0, 0))
+            present()
+            redraw = False
+            if startup.ready_ms is None:
+                startup.ready()
+                if os.environ.get("PANDA_STARTUP_REPORT"):
+                    startup.report()
 
         for event in pygame.event.get():  # <-- KEYDOWN must be inside this loop
+            redraw = True
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
@@ -672,11 +2613,11 @@ def main_menu():
                 if event.key == pygame.K_1:
                     result = level1(window)
                     if result == "next":
-                        pygame.time.delay(2000)
+                        # level2 was preloaded while level1 ran
                         level2(window)
 
                 elif event.key == pygame.K_2:
-                    print("Settings selected (not implemented).")
+                    settings_menu()
 
                 elif event.key == pygame.K_3:
                     pygame.quit()
@@ -684,5 +2625,79 @@ def main_menu():
 
         clock.tick(30)
 
+def headless_main(argv):
+    os.environ.setdefault("PANDA_HEADLESS", "1")
+    import argparse
+    parser = argparse.ArgumentParser(description="Run levels headless at uncapped speed.")
+    parser.add_argument("level")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--frames", type=int, default=3600)
+    parser.add_argument("--render", action="store_true")
+    args = parser.parse_args(argv)
+    # scripted run: walk right, jumping and attacking in bursts
+    segments = [(30, Input(False, True, False, False)), (5, Input(False, True, True, False)),
+                (20, Input(False, True, False, True))]
+    results = {}
+    start = time.perf_counter()
+    steps = 0
+    for _ in range(args.runs):
+        result, world = run_headless(args.level, itertools.cycle(scripted_input(segments)),
+                                     args.frames, args.render)
+        results[result] = results.get(result, 0) + 1
+        steps += world.frame
+    elapsed = time.perf_counter() - start
+    print(f"{args.runs} runs, {steps} steps in {elapsed:.2f}s "
+          f"({steps / elapsed:.0f} steps/s, {steps / elapsed / TICK_RATE:.1f}x real-time)")
+    print("results:", results)
+
+def replay_main(argv):
+    os.environ.setdefault("PANDA_HEADLESS", "1")
+    for path in argv:
+        start = time.perf_counter()
+        result, world, mismatches = replay(path)
+        elapsed = time.perf_counter() - start
+        status = f"DESYNC at ticks {mismatches[:5]}" if mismatches else "in sync"
+        print(f"{path}: {world.level.name} -> {result} after {world.frame} ticks "
+              f"in {elapsed:.2f}s ({world.frame / elapsed:.0f} ticks/s), {status}")
+
+def bake_assets(path=ASSET_PACK_FILE):
+    # loads what the menu and every level use, then writes it all to the pack
+    assets.pack_path = None
+    assets.budget_bytes = sys.maxsize
+    start = time.perf_counter()
+    init_display()
+    compose_menu()
+    get_tiles()
+    for filename in sorted(os.listdir(LEVEL_DIR)):
+        if filename.endswith(".json"):
+            World(filename[:-5])
+    baked = {}
+    for key, (value, _) in assets.cache.items():
+        surfaces = value if isinstance(value, list) else [value]
+        if (isinstance(key[0], str) and os.path.isfile(key[0])
+                and all(isinstance(s, pygame.Surface) for s in surfaces)):
+            baked[key] = value
+    # an unscaled source is only worth baking when nothing scaled is made from it
+    scaled = {(key[0], key[2]) for key in baked if key[1] is not None}
+    baked = {key: value for key, value in baked.items() if key[1] is not None or (key[0], key[2]) not in scaled}
+    size = AssetPack.write(path, baked)
+    print(f"Baked {len(baked)} assets ({size / 1024 / 1024:.1f} MB) into {path} "
+          f"in {time.perf_counter() - start:.2f}s")
+
+# Lazily created module globals kept for code that reads levels.window etc.
+def __getattr__(name):
+    if name == "window": return get_window()
+    if name == "font": return get_font()
+    if name == "menu_bg": return get_menu_bg()
+    if name == "tiles": return get_tiles()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == "__main__":
-    main_menu()
+    if len(sys.argv) > 1 and sys.argv[1] == "--headless":
+        headless_main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "--replay":
+        replay_main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "--bake-assets":
+        bake_assets(*sys.argv[2:3])
+    else:
+        main_menu()
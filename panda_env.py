@@ -0,0 +1,239 @@
+import os
+os.environ.setdefault("PANDA_HEADLESS", "1")
+import sys
+import time
+import argparse
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import levels
+from levels import World, input_from_mask, seed_simulation
+
+# ============================================================
+#        Environment API for automated players (headless)
+# ============================================================
+# env = PandaEnv("level1")
+# obs, info = env.reset(seed=0)
+# obs, reward, terminated, truncated, info = env.step(action)
+#
+# An action is an int 0..15 whose bits press left, right, jump and attack,
+# the same layout as the input recordings (levels.input_mask).
+# The observation is a float32 vector of OBS_SIZE:
+#   player   x, y, x_vel, y_vel, health, jump_count, is_attacking
+#   patrols  PATROL_SLOTS x (x, y, health, alive), bosses first
+#   balls    BALL_SLOTS x (x, y, vx, present), nearest to the player first
+#   goal     key collected, door opened
+# Reward is horizontal progress as a fraction of the level width, plus 1
+# for reaching the next level and -1 for dying or falling off the map.
+#
+# VecEnv steps N of these in worker processes; observations, rewards and
+# flags live in shared memory so only a one-word command crosses the pipe.
+# python panda_env.py --envs 8 --procs 1,2,4   -> steps/s per process count
+
+ACTIONS = 16
+PLAYER_FIELDS = 7
+PATROL_SLOTS = 8
+BALL_SLOTS = 8
+OBS_SIZE = PLAYER_FIELDS + PATROL_SLOTS * 4 + BALL_SLOTS * 4 + 2
+MAX_STEPS = 60 * levels.TICK_RATE
+
+
+class PandaEnv:
+    def __init__(self, level="level1", max_steps=MAX_STEPS):
+        self.level = level
+        self.max_steps = max_steps
+        self.world = None
+        self.start = None
+
+    # Each env owns its World; reset restores the start snapshot rather
+    # than rebuilding it.
+    def reset(self, seed=None, obs=None):
+        if seed is not None:
+            seed_simulation(seed)
+        if self.world is None:
+            self.world = World(self.level)
+            self.start = self.world.snapshot()
+        else:
+            self.world.restore(self.start)
+        return self.observe(obs), {"level": self.level}
+
+    # Snapshots let a caller branch: try several actions from one state.
+    def snapshot(self):
+        return self.world.snapshot()
+
+    def restore(self, snap, obs=None):
+        self.world.restore(snap)
+        return self.observe(obs)
+
+    def step(self, action, obs=None):
+        world = self.world
+        width = world.level.width
+        before = min(world.player.rect.x, width)
+        result = world.step(input_from_mask(int(action)))
+        if result is None and world.player.rect.top > world.level.height:
+            result = "fell"   # nothing below the tilemap ever ends the level
+        reward = (min(world.player.rect.x, width) - before) / width
+        if result == "next":
+            reward += 1.0
+        elif result in ("dead", "fell"):
+            reward -= 1.0
+        terminated = result is not None
+        truncated = not terminated and world.frame >= self.max_steps
+        return self.observe(obs), reward, terminated, truncated, {"result": result, "frame": world.frame}
+
+    def observe(self, out=None):
+        out = np.zeros(OBS_SIZE, np.float32) if out is None else out
+        out[:] = 0
+        world = self.world
+        p = world.player
+        out[:PLAYER_FIELDS] = (p.rect.x, p.rect.y, p.x_vel, p.y_vel, p.health, p.jump_count, p.is_attacking)
+
+        i = PLAYER_FIELDS
+        patrols = world.patrols
+        n = min(patrols.count, PATROL_SLOTS)
+        block = out[i:i + PATROL_SLOTS * 4].reshape(PATROL_SLOTS, 4)
+        block[:n, 0] = patrols.x[:n]
+        block[:n, 1] = patrols.y[:n]
+        block[:n, 2] = patrols.health[:n]
+        block[:n, 3] = patrols.alive[:n]
+
+        i += PATROL_SLOTS * 4
+        pool = world.projectiles
+        live = np.flatnonzero(pool.alive)
+        live = live[np.argsort(np.abs(pool.x[live] - p.rect.centerx), kind="stable")][:BALL_SLOTS]
+        block = out[i:i + BALL_SLOTS * 4].reshape(BALL_SLOTS, 4)
+        block[:len(live), 0] = pool.x[live]
+        block[:len(live), 1] = pool.y[live]
+        block[:len(live), 2] = pool.vx[live]
+        block[:len(live), 3] = 1.0
+
+        i += BALL_SLOTS * 4
+        out[i] = bool(world.key and world.key["collected"])
+        out[i + 1] = world.door_opened
+        return out
+
+
+# ---- Vectorized environments ----
+def _buffers(shms, count):
+    # the arrays point into the mappings, so shms must outlive them
+    obs = np.ndarray((count, OBS_SIZE), np.float32, buffer=shms[0].buf)
+    actions = np.ndarray(count, np.int8, buffer=shms[1].buf)
+    rewards = np.ndarray(count, np.float32, buffer=shms[2].buf)
+    flags = np.ndarray((count, 2), bool, buffer=shms[3].buf)   # terminated, truncated
+    return obs, actions, rewards, flags
+
+
+def _worker(conn, names, count, indices, env_levels, max_steps):
+    shms = [shared_memory.SharedMemory(name=name) for name in names]
+    obs, actions, rewards, flags = _buffers(shms, count)
+    envs = {i: PandaEnv(env_levels[i], max_steps) for i in indices}
+    try:
+        while True:
+            cmd, arg = conn.recv()
+            if cmd == "reset":
+                for i, env in envs.items():
+                    env.reset(None if arg is None else arg + i, obs[i])
+                conn.send(None)
+            elif cmd == "step":
+                results = {}
+                for i, env in envs.items():
+                    _, rewards[i], flags[i, 0], flags[i, 1], info = env.step(actions[i], obs[i])
+                    if flags[i].any():
+                        # auto-reset; the final result travels back in the infos
+                        results[i] = info["result"]
+                        env.reset(obs=obs[i])
+                conn.send(results)
+            elif cmd == "close":
+                break
+    finally:
+        del obs, actions, rewards, flags
+        for shm in shms:
+            shm.close()
+        conn.close()
+
+
+class VecEnv:
+    def __init__(self, env_levels, processes=None, max_steps=MAX_STEPS):
+        env_levels = [env_levels] if isinstance(env_levels, str) else list(env_levels)
+        self.count = count = len(env_levels)
+        processes = max(1, min(processes or os.cpu_count() or 1, count))
+        sizes = (count * OBS_SIZE * 4, count, count * 4, count * 2)
+        self._shms = [shared_memory.SharedMemory(create=True, size=size) for size in sizes]
+        names = [shm.name for shm in self._shms]
+        self.obs, self.actions, self.rewards, self.flags = _buffers(self._shms, count)
+        # spawn, so workers never inherit SDL state from the parent
+        ctx = mp.get_context("spawn")
+        self._conns, self._procs = [], []
+        for chunk in np.array_split(np.arange(count), processes):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_worker, daemon=True,
+                               args=(child, names, count, chunk.tolist(), env_levels, max_steps))
+            proc.start()
+            child.close()
+            self._conns.append(parent)
+            self._procs.append(proc)
+
+    def _broadcast(self, cmd, arg=None):
+        for conn in self._conns:
+            conn.send((cmd, arg))
+        return [conn.recv() for conn in self._conns]
+
+    def reset(self, seed=None):
+        self._broadcast("reset", seed)
+        return self.obs.copy()
+
+    # Environments that finish are reset in place; infos[i]["result"] holds
+    # how they finished and obs[i] is already the first observation after.
+    def step(self, actions):
+        self.actions[:] = actions
+        infos = [{} for _ in range(self.count)]
+        for results in self._broadcast("step"):
+            for i, result in results.items():
+                infos[i]["result"] = result
+        return self.obs.copy(), self.rewards.copy(), self.flags[:, 0].copy(), self.flags[:, 1].copy(), infos
+
+    def close(self):
+        if not self._procs:
+            return
+        for conn in self._conns:
+            conn.send(("close", None))
+        for proc in self._procs:
+            proc.join()
+        self._procs = []
+        del self.obs, self.actions, self.rewards, self.flags
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure vectorized environment throughput.")
+    parser.add_argument("--envs", type=int, default=8)
+    parser.add_argument("--procs", default="1,2,4", help="comma separated process counts")
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--level", default="level1")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    for procs in map(int, args.procs.split(",")):
+        with VecEnv([args.level] * args.envs, procs) as env:
+            env.reset(seed=0)
+            start = time.perf_counter()
+            for _ in range(args.steps):
+                env.step(rng.integers(0, ACTIONS, args.envs))
+            elapsed = time.perf_counter() - start
+        steps = args.steps * args.envs
+        print(f"{procs} procs x {args.envs} envs: {steps / elapsed:,.0f} steps/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())